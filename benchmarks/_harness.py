@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+import time
+import tracemalloc
+
+
+def summarize(timings, peak=None):
+    return {'best_s': min(timings),
+            'mean_s': sum(timings) / len(timings),
+            'peak_bytes': peak}
+
+
+def measure(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # memory is measured on a separate call, tracemalloc slows things down
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return summarize(timings, peak)
+
+
+def report(results):
+    width = max(map(len, results), default=0)
+    for name, result in results.items():
+        line = (f"{name:<{width}}  best {result['best_s'] * 1000:10.3f} ms"
+                f"  mean {result['mean_s'] * 1000:10.3f} ms")
+        # not every benchmark can attribute memory to what it measures
+        if result['peak_bytes'] is not None:
+            line += f"  peak {result['peak_bytes'] / 1024:10.1f} KiB"
+        print(line)
+
+
+def dump(results, path):
+    with open(path, 'w') as fh:
+        json.dump(results, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def load(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.10):
+    # Only the best time is compared, the mean is too noisy on shared runners
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if result['best_s'] > old['best_s'] * (1 + time_tolerance):
+            regressions.append(
+                f"{name}: best {result['best_s'] * 1000:.3f} ms, was"
+                f" {old['best_s'] * 1000:.3f} ms")
+        if result['peak_bytes'] is None or old['peak_bytes'] is None:
+            continue
+        if result['peak_bytes'] > old['peak_bytes'] * (1 + memory_tolerance):
+            regressions.append(
+                f"{name}: peak {result['peak_bytes'] / 1024:.1f} KiB, was"
+                f" {old['peak_bytes'] / 1024:.1f} KiB")
+    return regressions
@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+# Microbenchmarks for galaxy_esc/galaxy_unesc and _clean_inputs.
+#
+#     python benchmarks/bench_escape.py [--json OUT]
+import os
+import sys
+
+import click
+
+sys.path.insert(0, os.path.dirname(__file__))
+from _harness import measure, report, dump  # noqa: E402
+
+from q2galaxy.__main__ import _clean_inputs  # noqa: E402
+from q2galaxy.core.util import (galaxy_esc, galaxy_unesc,  # noqa: E402
+                                galaxy_ui_var)
+
+_TYPES = ['FeatureTable[Frequency]',
+          'SampleData[PairedEndSequencesWithQuality]',
+          'FeatureData[Taxonomy % Properties("consensus")]',
+          'Phylogeny[Rooted]']
+_WHERE = "[body-site]='gut' AND \"subject\" IN {'subject-1', 'subject-2'}"
+
+
+def make_wide(n):
+    return {
+        galaxy_ui_var(tag='section', name='extra_opts'): {
+            'where': galaxy_esc(_WHERE),
+            'flag': galaxy_esc(True),
+        },
+        'input': [{'source_path': f'/data/dataset_{i}.dat',
+                   'staging_path': f'/staging/sample-{i}.qza'}
+                  for i in range(n)],
+        'values': [{'element': galaxy_esc(f'value,{i}')} for i in range(n)],
+    }
+
+
+def make_deep(depth):
+    inputs = {'param': galaxy_esc(_WHERE)}
+    for i in range(depth):
+        inputs = {galaxy_ui_var(tag='conditional', name=f'level{i}'): inputs,
+                  f'param{i}': galaxy_esc(None)}
+    return inputs
+
+
+@click.command()
+@click.option('--json', 'json_path', default=None,
+              type=click.Path(dir_okay=False))
+@click.option('--repeat', default=5)
+def main(json_path, repeat):
+    types = _TYPES * 2500
+    escaped = [galaxy_esc(t) for t in types]
+    results = {}
+
+    results['galaxy_esc[10k types]'] = measure(
+        lambda: [galaxy_esc(t) for t in types], repeat)
+    results['galaxy_unesc[10k types]'] = measure(
+        lambda: [galaxy_unesc(t) for t in escaped], repeat)
+
+    for n in (100, 10_000, 50_000):
+        inputs = make_wide(n)
+        results[f'_clean_inputs[wide={n}]'] = measure(
+            lambda: _clean_inputs(inputs), repeat)
+
+    for depth in (10, 1000, 5000):
+        inputs = make_deep(depth)
+        results[f'_clean_inputs[deep={depth}]'] = measure(
+            lambda: _clean_inputs(inputs), repeat)
+
+    report(results)
+    if json_path is not None:
+        dump(results, json_path)
+
+
+if __name__ == '__main__':
+    main()
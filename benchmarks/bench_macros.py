@@ -0,0 +1,104 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+# Rendered size and parse time of the tools, as plain XML and with suite
+# macros (--macros) and/or minified output (--minify). The parse time is what
+# Galaxy's loader pays for a suite: every tool, plus its macros.xml, which is
+# read again for each tool that imports it.
+#
+#     python benchmarks/bench_macros.py [--plugin ID ...] [--repeat R]
+#         [--json OUT]
+import os
+import sys
+import tempfile
+
+import click
+import lxml.etree as xml
+
+import qiime2.sdk as sdk
+
+sys.path.insert(0, os.path.dirname(__file__))
+from _harness import measure, report, dump  # noqa: E402
+
+from q2galaxy.api import (template_plugin_iter,  # noqa: E402
+                          template_builtins_iter)
+from q2galaxy.core.templaters import MACROS_FILENAME  # noqa: E402
+from q2galaxy.core.util import get_mystery_stew  # noqa: E402
+
+_MODES = {'plain': (False, False), 'minify': (False, True),
+          'macros': (True, False), 'macros+minify': (True, True)}
+
+
+def render(plugins, directory, macros, minify):
+    for plugin in plugins:
+        for _ in template_plugin_iter(plugin, directory, macros=macros,
+                                      minify=minify):
+            pass
+    for _ in template_builtins_iter(directory, macros=macros, minify=minify):
+        pass
+
+
+def collect(directory):
+    tools = []
+    nbytes = 0
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d != 'test-data']
+        macros = os.path.join(root, MACROS_FILENAME)
+        for name in sorted(files):
+            if not name.endswith('.xml'):
+                continue
+            path = os.path.join(root, name)
+            nbytes += os.path.getsize(path)
+            if name != MACROS_FILENAME:
+                tools.append((path, macros if os.path.exists(macros)
+                              else None))
+    return tools, nbytes
+
+
+def parse(tools):
+    for tool, macros in tools:
+        xml.parse(tool)
+        if macros is not None:
+            xml.parse(macros)
+
+
+@click.command()
+@click.option('--plugin', 'plugin_ids', multiple=True,
+              help='Plugins to render, mystery_stew by default.')
+@click.option('--repeat', default=5)
+@click.option('--json', 'json_path', default=None,
+              type=click.Path(dir_okay=False))
+def main(plugin_ids, repeat, json_path):
+    if plugin_ids:
+        pm = sdk.PluginManager()
+        plugins = [pm.get_plugin(id=id_) for id_ in plugin_ids]
+    else:
+        plugins = [get_mystery_stew()]
+
+    results = {}
+    sizes = {}
+    with tempfile.TemporaryDirectory(prefix='q2galaxy-bench-') as tmp:
+        for mode, (macros, minify) in _MODES.items():
+            directory = os.path.join(tmp, mode)
+            os.mkdir(directory)
+            render(plugins, directory, macros, minify)
+            tools, sizes[mode] = collect(directory)
+            results[f'parse[{mode}]'] = measure(lambda: parse(tools), repeat)
+
+    report(results)
+    plain = sizes['plain']
+    for mode, nbytes in sizes.items():
+        print(f'{mode:<14} {nbytes / 1024:10.1f} KiB'
+              f'  ({nbytes / plain:6.1%} of plain)')
+
+    if json_path is not None:
+        dump({**results, **{f'bytes[{mode}]': nbytes
+                            for mode, nbytes in sizes.items()}}, json_path)
+
+
+if __name__ == '__main__':
+    main()
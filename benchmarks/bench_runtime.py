@@ -0,0 +1,331 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+# What q2galaxy itself adds to a job, separate from the plugin's own work.
+# mystery_stew actions are driven through action_runner (and the export tool
+# through builtin_runner) with generated inputs: scalars only, collections of
+# 1/100/1000 artifacts, and wide metadata. Each phase is read back from the
+# metrics sidecar (Q2GALAXY_METRICS_FILE), and the action body ("execute", or
+# "transform" for export) is excluded from the overhead.
+#
+#     python benchmarks/bench_runtime.py [--repeat R] [--json OUT]
+#         [--baseline FILE | --no-baseline] [--save-baseline FILE]
+#
+# Exits non-zero when --baseline is given and a result is slower than it by
+# more than the tolerance, or it doesn't exist.
+import os
+import sys
+import json
+import time
+import tempfile
+import contextlib
+import subprocess
+
+import click
+
+import qiime2.sdk as sdk
+from qiime2.core.type.util import is_collection_type, is_metadata_type
+
+sys.path.insert(0, os.path.dirname(__file__))
+from _harness import summarize, report, dump, load, compare  # noqa: E402
+
+from q2galaxy.__main__ import _clean_inputs  # noqa: E402
+from q2galaxy.core.peek import peek  # noqa: E402
+from q2galaxy.core.usage import collect_test_data  # noqa: E402
+from q2galaxy.core.util import (get_mystery_stew, galaxy_esc,  # noqa: E402
+                                galaxy_ui_var)
+from q2galaxy.core.drivers import action_runner, builtin_runner  # noqa: E402
+from q2galaxy.core.drivers.metrics import METRICS_FILE_ENV  # noqa: E402
+
+_COLLECTION_SIZES = (1, 100, 1000)
+_METADATA_SHAPE = (100, 1000)  # rows, columns
+# the part of each runner which is the plugin's (or QIIME 2's) work
+_BODY_PHASES = {'execute', 'transform'}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def find_archives(plugin, data_dir):
+    # The usage examples write out an artifact of most of stew's types
+    for action in plugin.actions.values():
+        for _ in collect_test_data(action, data_dir):
+            pass
+
+    archives = {}
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if name.endswith('.qza') and os.path.isfile(path):
+            archives.setdefault(sdk.parse_type(peek(path).type), path)
+    return archives
+
+
+def write_metadata(path, rows, columns):
+    with open(path, 'w') as fh:
+        fh.write('\t'.join(['id', *(f'col{j}' for j in range(columns))]))
+        fh.write('\n')
+        for i in range(rows):
+            fh.write('\t'.join([f'sample-{i}',
+                                *(str(i * j) for j in range(columns))]))
+            fh.write('\n')
+    return path
+
+
+def _archive_for(archives, type_):
+    for archive_type, path in archives.items():
+        if archive_type <= type_:
+            return path
+    raise _Unsupported(type_)
+
+
+def _primitive_for(spec):
+    if spec.has_default():
+        return spec.default
+
+    type_ = spec.qiime_type
+    candidates = [1, 0, 0.5, 'a', True, False]
+    template = getattr(type_.predicate, 'template', None)
+    if getattr(template, 'start', None) is not None:
+        candidates.insert(0, template.start)
+    candidates = list(getattr(template, 'choices', ())) + candidates
+
+    for candidate in candidates:
+        if is_collection_type(type_):
+            candidate = [candidate]
+        if candidate in type_:
+            return candidate
+    raise _Unsupported(type_)
+
+
+def make_inputs(action, archives, metadata_path, elements=1):
+    signature = action.signature
+    inputs = {}
+    for name, spec in signature.inputs.items():
+        type_ = spec.qiime_type
+        if is_collection_type(type_):
+            path = _archive_for(archives, type_.fields[0])
+            inputs[name] = [{'source_path': path,
+                             'staging_path': f'element-{i}.qza'}
+                            for i in range(elements)]
+        else:
+            inputs[name] = {'source_path': _archive_for(archives, type_),
+                            'staging_path': f'{name}.qza'}
+
+    for name, spec in signature.parameters.items():
+        type_ = spec.qiime_type
+        if type_.name == 'Metadata':
+            inputs[name] = [{'type': 'tsv',
+                             'source': {'source_path': metadata_path,
+                                        'staging_path': 'metadata.tsv'}}]
+        elif is_metadata_type(type_):
+            if not spec.has_default():
+                raise _Unsupported(type_)
+            inputs[name] = None
+        else:
+            inputs[name] = _primitive_for(spec)
+
+    return inputs
+
+
+def to_galaxy(inputs):
+    # Roughly what Galaxy writes for `$inputs`: escaped scalars, with some of
+    # them nested in the additional options section.
+    section = {}
+    raw = {galaxy_ui_var(tag='section', name='extra_opts'): section}
+    for name, value in inputs.items():
+        if type(value) in (list, dict):
+            raw[name] = value
+        elif type(value) in (str, bool) or value is None:
+            section[name] = galaxy_esc(value)
+        else:
+            section[name] = value
+    return raw
+
+
+def select_configs(plugin, archives, metadata_path):
+    def kinds(action):
+        signature = action.signature
+        collections = [n for n, s in signature.inputs.items()
+                       if is_collection_type(s.qiime_type)]
+        metadata = [n for n, s in signature.parameters.items()
+                    if s.qiime_type.name == 'Metadata']
+        return signature, collections, metadata
+
+    wanted = {'scalar': None, 'collection': None, 'metadata': None}
+    for action in plugin.actions.values():
+        signature, collections, metadata = kinds(action)
+        if not signature.inputs and not metadata and signature.parameters:
+            kind = 'scalar'
+        elif len(collections) == 1 and not metadata:
+            kind = 'collection'
+        elif metadata and not collections:
+            kind = 'metadata'
+        else:
+            continue
+
+        if wanted[kind] is not None:
+            continue
+        try:
+            make_inputs(action, archives, metadata_path)
+        except _Unsupported:
+            continue
+        wanted[kind] = action
+
+    configs = {}
+    for kind, action in wanted.items():
+        if action is None:
+            click.secho(f'No suitable mystery_stew action for {kind!r}.',
+                        fg='yellow', err=True)
+        elif kind == 'collection':
+            for size in _COLLECTION_SIZES:
+                configs[f'{kind}={size}'] = (action, make_inputs(
+                    action, archives, metadata_path, elements=size))
+        else:
+            configs[kind] = (action, make_inputs(action, archives,
+                                                 metadata_path))
+    return configs
+
+
+@contextlib.contextmanager
+def _quiet():
+    # The runners replay stdio (and the metrics footer) at the fd level
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in (devnull, *saved):
+            os.close(fd)
+
+
+def run_job(runner, inputs_path, work_dir):
+    metrics_path = os.path.join(work_dir, 'metrics.json')
+    cwd = os.getcwd()
+    os.environ[METRICS_FILE_ENV] = metrics_path
+    os.chdir(work_dir)
+    try:
+        with _quiet():
+            start = time.perf_counter()
+            with open(inputs_path) as fh:
+                config = _clean_inputs(json.load(fh))
+            clean_s = time.perf_counter() - start
+            runner(config)
+    finally:
+        os.chdir(cwd)
+        del os.environ[METRICS_FILE_ENV]
+
+    with open(metrics_path) as fh:
+        metrics = json.load(fh)
+
+    timings = {'clean_inputs': clean_s}
+    for record in metrics['phases']:
+        timings[record['phase']] = record['wall_s']
+    # the rest is capturing and replaying stdio (and the metrics themselves)
+    timings['stdio'] = metrics['total']['wall_s'] - sum(
+        record['wall_s'] for record in metrics['phases'])
+    timings['overhead'] = sum(v for k, v in timings.items()
+                              if k not in _BODY_PHASES)
+    return timings
+
+
+def bench_job(label, runner, inputs, tmp, repeat):
+    inputs_path = os.path.join(tmp, f'{label}.json')
+    with open(inputs_path, 'w') as fh:
+        json.dump(to_galaxy(inputs), fh)
+
+    runs = []
+    for idx in range(repeat):
+        work_dir = os.path.join(tmp, f'{label}-{idx}')
+        os.mkdir(work_dir)
+        runs.append(run_job(runner, inputs_path, work_dir))
+
+    return {f'{label}:{phase}': summarize([run[phase] for run in runs])
+            for phase in runs[0]}
+
+
+def bench_import(repeat):
+    def _time(code):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True)
+            timings.append(time.perf_counter() - start)
+        return summarize(timings)
+
+    return {'cli_import:python': _time('pass'),
+            'cli_import:q2galaxy': _time('import q2galaxy.__main__')}
+
+
+@click.command()
+@click.option('--repeat', default=5)
+@click.option('--json', 'json_path', default=None,
+              type=click.Path(dir_okay=False))
+@click.option('--baseline', default=None, type=click.Path(dir_okay=False),
+              help='Fail if any result regresses against this file, or if'
+                   ' it is missing.')
+@click.option('--no-baseline', is_flag=True, default=False,
+              help="Don't compare against a baseline, even with --baseline.")
+@click.option('--save-baseline', default=None,
+              type=click.Path(dir_okay=False))
+@click.option('--time-tolerance', default=0.25)
+def main(repeat, json_path, baseline, no_baseline, save_baseline,
+         time_tolerance):
+    if no_baseline:
+        baseline = None
+    elif baseline is not None and not os.path.exists(baseline):
+        raise click.BadParameter(
+            f'No baseline at {baseline}, save one with --save-baseline (or'
+            ' `make bench-baseline`), or pass --no-baseline.',
+            param_hint="'--baseline'")
+
+    results = bench_import(repeat)
+
+    plugin = get_mystery_stew()
+    with tempfile.TemporaryDirectory(prefix='q2galaxy-bench-') as tmp:
+        data_dir = os.path.join(tmp, 'data')
+        os.mkdir(data_dir)
+        archives = find_archives(plugin, data_dir)
+        metadata_path = write_metadata(os.path.join(tmp, 'metadata.tsv'),
+                                       *_METADATA_SHAPE)
+
+        for label, (action, inputs) in select_configs(
+                plugin, archives, metadata_path).items():
+            def runner(config, action_id=action.id):
+                action_runner(plugin.id, action_id, config)
+            results.update(bench_job(label, runner, inputs, tmp, repeat))
+
+        export = {'input': next(iter(archives.values())),
+                  'fmt_finder': {'output_format': 'None'}}
+        results.update(bench_job(
+            'export', lambda config: builtin_runner('export', config),
+            export, tmp, repeat))
+
+    report(results)
+    if json_path is not None:
+        dump(results, json_path)
+    if save_baseline is not None:
+        dump(results, save_baseline)
+
+    if baseline is not None:
+        regressions = compare(results, load(baseline), time_tolerance)
+        for regression in regressions:
+            click.secho(regression, fg='red', err=True)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+# Templating benchmarks over mystery_stew and synthetic plugins of N actions
+# with M parameters, each a union of K primitive branches.
+#
+#     python benchmarks/bench_templating.py [--scale N,M,K ...] [--no-stew]
+#         [--baseline FILE | --no-baseline] [--save-baseline FILE]
+#         [--json OUT]
+#
+# Exits non-zero when --baseline is given and a result is slower (or uses
+# more memory) than it by more than the tolerance, or it doesn't exist.
+import os
+import sys
+import json
+import operator
+import functools
+import tempfile
+
+import click
+
+from qiime2.plugin import Plugin, Int, Float, Str, Range, Choices
+
+sys.path.insert(0, os.path.dirname(__file__))
+from _harness import measure, report, dump, load, compare  # noqa: E402
+
+from q2galaxy.core.util import write_tool, get_mystery_stew  # noqa: E402
+from q2galaxy.core.environment import CondaMeta  # noqa: E402
+from q2galaxy.core.templaters import (make_tool, make_tool_id,  # noqa: E402
+                                      iter_builtin_makers, registry_index)
+from q2galaxy.core.templaters.helpers import (  # noqa: E402
+    signature_to_galaxy)
+from q2galaxy.core.templaters.import_data import (  # noqa: E402
+    make_builtin_import)
+from q2galaxy.core.templaters.export_data import (  # noqa: E402
+    make_builtin_export)
+
+_DEFAULT_SCALES = ('10,10,1', '10,10,8', '50,20,4')
+_PROJECT = 'q2-bench'
+_METAPACKAGE = 'qiime2-bench'
+_DEPENDENCY_DEPTH = 20
+
+
+def make_prefix(directory):
+    # A stand-in conda prefix, so requirements are resolved the same way on
+    # any machine: the synthetic project has a chain of dependencies.
+    meta = os.path.join(directory, 'conda-meta')
+    os.makedirs(meta)
+
+    packages = {_PROJECT: ['dep-0'], _METAPACKAGE: [_PROJECT]}
+    for i in range(_DEPENDENCY_DEPTH):
+        packages[f'dep-{i}'] = [f'dep-{i + 1} >=1.0', '__glibc >=2.17']
+    packages[f'dep-{_DEPENDENCY_DEPTH}'] = []
+
+    for name, depends in packages.items():
+        with open(os.path.join(meta, f'{name}-1.0-0.json'), 'w') as fh:
+            json.dump({'version': '1.0', 'depends': depends}, fh)
+
+    return directory
+
+
+def _branch(i):
+    kind = i % 3
+    if kind == 0:
+        return Int % Range(10 * i, 10 * i + 5)
+    elif kind == 1:
+        return Str % Choices(*[f'choice-{i}-{j}' for j in range(4)])
+    return Float % Range(float(i), i + 0.5)
+
+
+def _make_function(action_id, params):
+    namespace = {}
+    args = ', '.join(['output_dir', *params])
+    exec(f'def {action_id}({args}):\n    pass\n', namespace)
+    return namespace[action_id]
+
+
+def make_plugin(n_actions, n_params, n_branches):
+    plugin = Plugin(name=f'bench-{n_actions}x{n_params}x{n_branches}',
+                    version='0.0.0', website='https://qiime2.org',
+                    package='q2galaxy', project_name=_PROJECT,
+                    description='Synthetic plugin for benchmarking.',
+                    short_description='Synthetic plugin.')
+
+    type_ = functools.reduce(operator.or_,
+                             (_branch(i) for i in range(n_branches)))
+    params = [f'param_{i}' for i in range(n_params)]
+    for i in range(n_actions):
+        action_id = f'action_{i}'
+        plugin.visualizers.register_function(
+            function=_make_function(action_id, params),
+            inputs={},
+            parameters={p: type_ for p in params},
+            parameter_descriptions={p: f'The {p} of {action_id}.'
+                                    for p in params},
+            name=f'Action {i}',
+            description=f'Synthetic action {i}.')
+
+    return plugin
+
+
+def bench_plugin(label, plugin, meta, test_dir, repeat):
+    results = {}
+    actions = list(plugin.actions.values())
+
+    results[f'signature_to_galaxy[{label}]'] = measure(
+        lambda: [list(signature_to_galaxy(a.signature)) for a in actions],
+        repeat)
+    results[f'make_tool[{label}]'] = measure(
+        lambda: [make_tool(meta, plugin, a, test_dir) for a in actions],
+        repeat)
+
+    tools = [make_tool(meta, plugin, a, test_dir) for a in actions]
+    out = os.path.join(test_dir, '..')
+
+    def _write():
+        for action, tool in zip(actions, tools):
+            path = os.path.join(out, make_tool_id(plugin.id, action.id))
+            write_tool(tool, path + '.xml')
+
+    results[f'write_tool[{label}]'] = measure(_write, repeat)
+    return results
+
+
+@click.command()
+@click.option('--scale', 'scales', multiple=True, default=_DEFAULT_SCALES,
+              help='N,M,K: actions, parameters per action, and union'
+                   ' branches per parameter. May be repeated.')
+@click.option('--stew/--no-stew', default=True,
+              help='Also benchmark the mystery_stew plugin.')
+@click.option('--repeat', default=3)
+@click.option('--json', 'json_path', default=None,
+              type=click.Path(dir_okay=False))
+@click.option('--baseline', default=None, type=click.Path(dir_okay=False),
+              help='Fail if any result regresses against this file, or if'
+                   ' it is missing.')
+@click.option('--no-baseline', is_flag=True, default=False,
+              help="Don't compare against a baseline, even with --baseline.")
+@click.option('--save-baseline', default=None,
+              type=click.Path(dir_okay=False))
+@click.option('--time-tolerance', default=0.25)
+@click.option('--memory-tolerance', default=0.10)
+def main(scales, stew, repeat, json_path, baseline, no_baseline,
+         save_baseline, time_tolerance, memory_tolerance):
+    if no_baseline:
+        baseline = None
+    elif baseline is not None and not os.path.exists(baseline):
+        raise click.BadParameter(
+            f'No baseline at {baseline}, save one with --save-baseline (or'
+            ' `make bench-baseline`), or pass --no-baseline.',
+            param_hint="'--baseline'")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='q2galaxy-bench-') as tmp:
+        prefix = make_prefix(os.path.join(tmp, 'prefix'))
+        meta = CondaMeta(prefix)
+        builtin_meta = CondaMeta(prefix, metapackage=_METAPACKAGE)
+        test_dir = os.path.join(tmp, 'tools', 'test-data', '')
+        os.makedirs(test_dir)
+
+        for scale in scales:
+            n, m, k = (int(x) for x in scale.split(','))
+            plugin = make_plugin(n, m, k)
+            results.update(bench_plugin(f'{n}x{m}x{k}', plugin, meta,
+                                        test_dir, repeat))
+
+        if stew:
+            results.update(bench_plugin('mystery_stew', get_mystery_stew(),
+                                        meta, test_dir, repeat))
+
+        results['make_builtin_import'] = measure(
+            lambda: make_builtin_import(builtin_meta,
+                                        make_tool_id('tools', 'import')),
+            repeat)
+        results['make_builtin_export'] = measure(
+            lambda: make_builtin_export(builtin_meta,
+                                        make_tool_id('tools', 'export')),
+            repeat)
+
+        def _make_builtins(split):
+            # as `template builtins` does, sharing one registry index
+            with registry_index():
+                for tool_id, maker in iter_builtin_makers(split):
+                    maker(builtin_meta, tool_id)
+
+        results['make_builtins'] = measure(lambda: _make_builtins(False),
+                                           repeat)
+        results['make_builtins[split]'] = measure(
+            lambda: _make_builtins(True), repeat)
+
+    report(results)
+    if json_path is not None:
+        dump(results, json_path)
+    if save_baseline is not None:
+        dump(results, save_baseline)
+
+    if baseline is not None:
+        regressions = compare(results, load(baseline), time_tolerance,
+                              memory_tolerance)
+        for regression in regressions:
+            click.secho(regression, fg='red', err=True)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+# Writing the builtin tools (the largest q2galaxy renders) with write_tool,
+# against the serializer it replaced: sort a copy of the tree, indent it, and
+# serialize it in memory. Fails if the two outputs differ by a single byte.
+#
+#     python benchmarks/bench_write.py [--repeat R] [--split] [--json OUT]
+import os
+import sys
+import tempfile
+
+import click
+import lxml.etree as xml
+
+sys.path.insert(0, os.path.dirname(__file__))
+from _harness import measure, report, dump  # noqa: E402
+
+from q2galaxy.core import util  # noqa: E402
+from q2galaxy.core.environment import find_conda_meta  # noqa: E402
+from q2galaxy.core.templaters import (iter_builtin_makers,  # noqa: E402
+                                      registry_index)
+
+
+def legacy_write_tool(tool, filepath, minify=False):
+    tool = _legacy_sorted(tool)
+    tool.set('profile', '22.05')
+    tool.set('license', 'BSD-3-Clause')
+    tool.addprevious(xml.Comment(util.make_copyright()))
+    tool.addprevious(xml.Comment(
+        "\nThis tool was automatically generated by:\n"
+        f"    q2galaxy (version: {util.q2galaxy.__version__})\n"
+        "for:\n"
+        f"    qiime2 (version: {util.qiime2.__version__})\n"))
+
+    tool = xml.ElementTree(tool)
+    if not minify:
+        xml.indent(tool, ' ' * 4)
+    xmlbytes = xml.tostring(tool, pretty_print=not minify, encoding='utf-8',
+                            xml_declaration=True)
+    if minify:
+        xmlbytes += b'\n'
+    with open(filepath, 'wb') as fh:
+        fh.write(xmlbytes)
+    return len(xmlbytes)
+
+
+def _legacy_sorted(e):
+    new = _legacy_sorted_attrs(e)
+    new[:] = sorted(new, key=lambda x: util._TOOL_ORDER.index(x.tag))
+    return new
+
+
+def _legacy_sorted_attrs(e):
+    ranked = sorted((i for i in e.attrib.items() if i[0] in util._ATTR_RANK),
+                    key=lambda x: util._ATTR_ORDER.index(x[0]))
+    rest = sorted((i for i in e.attrib.items()
+                   if i[0] not in util._ATTR_RANK), key=lambda x: x[0])
+    new = xml.Element(e.tag, dict([*ranked, *rest]))
+    new.text = e.text
+    for child in e:
+        new.append(_legacy_sorted_attrs(child))
+    return new
+
+
+@click.command()
+@click.option('--repeat', default=5)
+@click.option('--split', is_flag=True, default=False,
+              help='Write the per-family import and export tools.')
+@click.option('--minify', is_flag=True, default=False)
+@click.option('--json', 'json_path', default=None,
+              type=click.Path(dir_okay=False))
+def main(repeat, split, minify, json_path):
+    meta = find_conda_meta()
+    with registry_index():
+        tools = {tool_id: maker(meta, tool_id)
+                 for tool_id, maker in iter_builtin_makers(split)}
+
+    results = {}
+    mismatched = []
+    with tempfile.TemporaryDirectory(prefix='q2galaxy-bench-') as tmp:
+        for tool_id, tool in tools.items():
+            legacy_path = os.path.join(tmp, 'legacy.xml')
+            path = os.path.join(tmp, 'streamed.xml')
+
+            results[f'legacy[{tool_id}]'] = measure(
+                lambda: legacy_write_tool(tool, legacy_path, minify), repeat)
+            results[f'write_tool[{tool_id}]'] = measure(
+                lambda: util.write_tool(tool, path, minify), repeat)
+
+            with open(legacy_path, 'rb') as a, open(path, 'rb') as b:
+                if a.read() != b.read():
+                    mismatched.append(tool_id)
+
+    report(results)
+    if json_path is not None:
+        dump(results, json_path)
+
+    for tool_id in mismatched:
+        click.secho(f'{tool_id}: write_tool differs from the legacy output',
+                    fg='red', err=True)
+    if mismatched:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
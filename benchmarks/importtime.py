@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+# Import-time gate for `q2galaxy run` (and `version`), which import only
+# q2galaxy.__main__ and the drivers. Fails if a templating-only module is
+# imported, or if the time spent importing q2galaxy's own modules, or
+# (optionally) everything, exceeds its budget.
+#
+#     python benchmarks/importtime.py [--own-budget-ms 150] [--budget-ms MS]
+import sys
+import subprocess
+
+import click
+
+_TARGET = 'q2galaxy.__main__'
+# Only `q2galaxy template` needs these
+_FORBIDDEN = ('lxml', 'q2galaxy.api', 'q2galaxy.core.templaters',
+              'q2galaxy.core.usage', 'q2galaxy.core.util', 'q2_types')
+
+
+def parse_importtime(stderr):
+    # lines look like: "import time:   self [us] | cumulative | package"
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue  # the header
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def sample(module):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+@click.command()
+@click.option('--repeat', default=5)
+@click.option('--own-budget-ms', default=150.0,
+              help='Budget for the self time of q2galaxy modules.')
+@click.option('--budget-ms', default=None, type=float,
+              help='Budget for the whole import, including QIIME 2.')
+def main(repeat, own_budget_ms, budget_ms):
+    samples = [sample(_TARGET) for _ in range(repeat)]
+    modules = samples[0]
+
+    failures = []
+    for name in modules:
+        for forbidden in _FORBIDDEN:
+            if name == forbidden or name.startswith(forbidden + '.'):
+                failures.append(f'{name} is imported by {_TARGET}')
+
+    # best of the samples, the first tends to be slowed by a cold disk cache
+    own_ms = min(sum(self_us for name, (self_us, _) in s.items()
+                     if name.split('.')[0] == 'q2galaxy')
+                 for s in samples) / 1000
+    total_ms = min(s[_TARGET][1] for s in samples) / 1000
+
+    print(f'{_TARGET}: {total_ms:.1f} ms total, {own_ms:.1f} ms in'
+          ' q2galaxy modules')
+    if own_ms > own_budget_ms:
+        failures.append(f'q2galaxy modules took {own_ms:.1f} ms to import,'
+                        f' the budget is {own_budget_ms:.1f} ms')
+    if budget_ms is not None and total_ms > budget_ms:
+        failures.append(f'{_TARGET} took {total_ms:.1f} ms to import, the'
+                        f' budget is {budget_ms:.1f} ms')
+
+    for failure in failures:
+        click.secho(failure, fg='red', err=True)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
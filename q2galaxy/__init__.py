@@ -5,14 +5,20 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
-from q2galaxy.api import (template_action, template_plugin, template_builtins,
-                          template_all)
-
-
 __version__ = '0.0.1'  # TODO: use versioneer
 __all__ = ['template_action', 'template_plugin', 'template_builtins',
            'template_all']
 
+
 from ._version import get_versions
 __version__ = get_versions()['version']
 del get_versions
+
+
+# The API is loaded on first use, importing q2galaxy (as `q2galaxy run` does,
+# if only for __version__) should not import every templater.
+def __getattr__(name):
+    if name in __all__:
+        import q2galaxy.api
+        return getattr(q2galaxy.api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -5,6 +5,7 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import os
 import json
 
 import click
@@ -12,19 +13,107 @@ import click
 import qiime2.sdk as sdk
 
 from q2galaxy.core.drivers import action_runner, builtin_runner, get_version
-from q2galaxy.api import (template_plugin_iter, template_all_iter,
-                          template_builtins_iter, template_tool_conf)
-from q2galaxy.core.util import galaxy_ui_var, get_mystery_stew, galaxy_unesc
+from q2galaxy.core.drivers.schema import load_input_schema
+from q2galaxy.core.escape import galaxy_ui_var, galaxy_unesc
+from q2galaxy.core.trace import TRACE_ENV, span, tracing
+
+# q2galaxy.api (and with it lxml and every templater) is imported by the
+# `template` subcommands themselves, as is q2galaxy.core.peek by `peek`, so
+# that `run` starts as fast as it can.
 
 _OUTPUT_DIR = click.Path(file_okay=False, dir_okay=True, exists=True)
 
 
+def _size_options(command):
+    command = click.option(
+        '--minify', is_flag=True, default=False,
+        help='Write the XML without indentation.')(command)
+    command = click.option(
+        '--macros', is_flag=True, default=False,
+        help='Share the blocks which repeat across a suite\'s tools'
+             ' (requirements, citations, format help) through a'
+             ' macros.xml.')(command)
+    return command
+
+
+def _parse_container(ctx, param, value):
+    if value is None:
+        return None
+
+    from q2galaxy.core.templaters.containers import parse_container
+
+    try:
+        return parse_container(param.name, value)
+    except ValueError as e:
+        raise click.BadParameter(str(e), ctx=ctx, param=param)
+
+
+def _container_options(command):
+    command = click.option(
+        '--singularity', type=str, default=None, callback=_parse_container,
+        help='A Singularity image of the distribution for every tool to'
+             ' run in.')(command)
+    command = click.option(
+        '--container', 'docker', type=str, default=None,
+        callback=_parse_container,
+        help='A Docker image of the distribution (pinned by digest, e.g.'
+             ' image@sha256:...) for every tool to run in. A'
+             ' q2galaxy-containers.json records the conda environment it'
+             ' should hold.')(command)
+    return command
+
+
+def _containers(*images):
+    return tuple(image for image in images if image is not None)
+
+
+_SPLIT_OPTION = click.option(
+    '--split-builtins', 'split', is_flag=True, default=False,
+    help='Template one import and one export tool per type family (e.g.'
+         ' FeatureTable) instead of a single tool covering every type.')
+
+
+_SNAPSHOT_OPTION = click.option(
+    '--snapshot', type=click.Path(file_okay=True, dir_okay=False,
+                                  exists=True),
+    default=None, help='Template the plugins recorded by `q2galaxy snapshot`'
+                       ' instead of those installed here.')
+
+
+def _load_snapshot(path):
+    if path is None:
+        return None
+
+    from q2galaxy.core.snapshot import load_snapshot
+
+    try:
+        return load_snapshot(path)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--snapshot'")
+
+
+def _parse_shard(ctx, param, value):
+    if value is None:
+        return None
+
+    from q2galaxy.core.manifest import parse_shard
+
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e), ctx=ctx, param=param)
+
+
 def _echo_status(status):
     line = json.dumps(status)
     if status['status'] == 'error':
         click.secho(line, fg='red', err=True)
     elif status['status'] == 'created':
         click.secho(line, fg='green')
+    elif status['status'] == 'summary':
+        click.secho(line, fg='cyan')
+    elif status['status'] == 'unchanged':
+        click.echo(line)
     else:
         click.secho(line, fg='yellow')
 
@@ -34,19 +123,58 @@ def root():
     pass
 
 
+_REPRODUCIBLE_OPTION = click.option(
+    '--reproducible', is_flag=True, default=False,
+    help='Write the same bytes each time: the dates come from'
+         ' SOURCE_DATE_EPOCH, and test data gets stable UUIDs.')
+
+
+def _enter_reproducible(ctx, enabled):
+    from q2galaxy.core.reproducible import reproducible
+
+    try:
+        ctx.with_resource(reproducible(enabled))
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+
 @root.group()
-def template():
-    pass
+@click.option('--trace', type=click.Path(file_okay=True, dir_okay=False),
+              default=None, help='Write a Chrome trace-event JSON file of'
+                                 ' where templating time is spent.')
+@_REPRODUCIBLE_OPTION
+@click.pass_context
+def template(ctx, trace, reproducible):
+    # flushed when the subcommand finishes
+    ctx.with_resource(tracing(trace))
+    _enter_reproducible(ctx, reproducible)
 
 
 @template.command()
 @click.argument('plugin', type=str)
 @click.argument('output', type=_OUTPUT_DIR)
 @click.option('--metapackage', type=str, default=None)
-def plugin(plugin, output, metapackage):
-    pm = sdk.PluginManager()
-    plugin = pm.get_plugin(id=plugin)
-    for status in template_plugin_iter(plugin, output, metapackage):
+@_size_options
+@_container_options
+@_SNAPSHOT_OPTION
+def plugin(plugin, output, metapackage, macros, minify, docker, singularity,
+           snapshot):
+    from q2galaxy.api import template_plugin_iter
+
+    containers = _containers(docker, singularity)
+    snapshot = _load_snapshot(snapshot)
+    if snapshot is not None:
+        if plugin not in snapshot.plugins:
+            raise click.BadParameter(f'{plugin} is not in the snapshot.',
+                                     param_hint="'PLUGIN'")
+        plugin = snapshot.plugins[plugin]
+    else:
+        pm = sdk.PluginManager()
+        plugin = pm.get_plugin(id=plugin)
+
+    for status in template_plugin_iter(plugin, output, metapackage, macros,
+                                       minify, containers=containers,
+                                       snapshot=snapshot):
         _echo_status(status)
 
 
@@ -54,8 +182,18 @@ def plugin(plugin, output, metapackage):
 @click.argument('output', type=_OUTPUT_DIR)
 @click.option('--distro', type=str, default=None)
 @click.option('--metapackage', type=str, default=None)
-def builtins(output, distro, metapackage):
-    for status in template_builtins_iter(output, distro, metapackage):
+@_size_options
+@_SPLIT_OPTION
+@_container_options
+@_SNAPSHOT_OPTION
+def builtins(output, distro, metapackage, macros, minify, split, docker,
+             singularity, snapshot):
+    from q2galaxy.api import template_builtins_iter
+
+    for status in template_builtins_iter(output, distro, metapackage, macros,
+                                         minify, split,
+                                         _containers(docker, singularity),
+                                         _load_snapshot(snapshot)):
         _echo_status(status)
 
 
@@ -63,15 +201,54 @@ def builtins(output, distro, metapackage):
 @click.argument('output', type=_OUTPUT_DIR)
 @click.option('--distro', type=str, default=None)
 @click.option('--metapackage', type=str, default=None)
-def all(output, distro, metapackage):
-    for status in template_all_iter(output, distro, metapackage):
+@_size_options
+@_SPLIT_OPTION
+@_container_options
+@_SNAPSHOT_OPTION
+@click.option('--shard', type=str, default=None, callback=_parse_shard,
+              help='i/N: template only the i-th of N (0-based) shards of'
+                   ' the actions, which `template merge` combines.')
+def all(output, distro, metapackage, macros, minify, split, docker,
+        singularity, snapshot, shard):
+    from q2galaxy.api import template_all_iter
+
+    for status in template_all_iter(output, distro, metapackage, macros,
+                                    minify, split, shard,
+                                    _containers(docker, singularity),
+                                    _load_snapshot(snapshot)):
         _echo_status(status)
 
 
+@template.command()
+@click.argument('output', type=_OUTPUT_DIR)
+@click.argument('shards', nargs=-1, required=True, type=_OUTPUT_DIR)
+@click.option('--tool-conf', type=click.Path(file_okay=True, dir_okay=False),
+              default=None, help='Also write a tool_conf.xml for the merged'
+                                 ' tools.')
+@click.option('--install-dir', type=str, default=None,
+              help='Where the tools will be installed, for --tool-conf.'
+                   ' Defaults to OUTPUT.')
+def merge(output, shards, tool_conf, install_dir):
+    from q2galaxy.api import template_merge_iter, template_tool_conf_iter
+
+    try:
+        for status in template_merge_iter(output, shards):
+            _echo_status(status)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    if tool_conf is not None:
+        for status in template_tool_conf_iter(install_dir or output,
+                                              tool_conf, manifest_dir=output):
+            _echo_status(status)
+
+
 @template.command()
 @click.argument('output', type=_OUTPUT_DIR)
 @click.pass_context
 def tests(ctx, output):
+    from q2galaxy.core.util import get_mystery_stew
+
     test_plugin = get_mystery_stew()
     ctx.invoke(plugin, plugin=test_plugin.id, output=output)
 
@@ -80,8 +257,38 @@ def tests(ctx, output):
 @click.argument('install_dir', type=str)
 @click.argument('output', type=click.Path(file_okay=True, dir_okay=False))
 @click.option('--distro', type=str, default=None)
-def tool_conf(install_dir, output, distro):
-    template_tool_conf(install_dir, output, distro=distro)
+@_SPLIT_OPTION
+@click.option('--manifest-dir', type=_OUTPUT_DIR, default=None,
+              help='The output of `template all` (or `template merge`): list'
+                   ' the tools its manifest does, without importing any'
+                   ' plugins.')
+@click.option('--prune', is_flag=True, default=False,
+              help='Delete the suites, tools, and test data in'
+                   ' --manifest-dir which its manifest doesn\'t list.')
+def tool_conf(install_dir, output, distro, split, manifest_dir, prune):
+    from q2galaxy.api import template_tool_conf_iter
+
+    try:
+        for status in template_tool_conf_iter(install_dir, output, distro,
+                                              split, manifest_dir, prune):
+            _echo_status(status)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+
+@root.command()
+@click.argument('output', type=click.Path(file_okay=True, dir_okay=False))
+@_REPRODUCIBLE_OPTION
+@click.pass_context
+def snapshot(ctx, output, reproducible):
+    # What `template` reads from the plugins, for `template ... --snapshot`
+    # to use on a machine without them (.gz paths are compressed)
+    from q2galaxy.api import snapshot_iter
+
+    _enter_reproducible(ctx, reproducible)
+
+    for status in snapshot_iter(output):
+        _echo_status(status)
 
 
 @root.command()
@@ -89,45 +296,125 @@ def tool_conf(install_dir, output, distro):
 @click.argument('action', type=str)
 @click.argument('inputs', type=click.Path(file_okay=True, dir_okay=False,
                                           exists=True))
-def run(plugin, action, inputs):
-    with open(inputs, 'r') as fh:
-        config = _clean_inputs(json.load(fh))
-    if plugin == 'tools':
-        builtin_runner(action, config)
-    else:
-        action_runner(plugin, action, config)
+@click.option('--schema', type=click.Path(file_okay=True, dir_okay=False,
+                                          exists=True),
+              default=None, help='The input schema templated alongside the'
+                                 ' tool, used to check the inputs up front.')
+def run(plugin, action, inputs, schema):
+    with tracing(os.environ.get(TRACE_ENV)):
+        with span('clean_inputs', cat='cli'):
+            with open(inputs, 'r') as fh:
+                config = _clean_inputs(json.load(fh))
+        if plugin == 'tools':
+            builtin_runner(action, config)
+        else:
+            # Tools templated before the schema existed won't pass one
+            if schema is not None:
+                schema = load_input_schema(schema)
+            action_runner(plugin, action, config, schema=schema)
 
 
-def _clean_inputs(inputs, collapse_single=False):
-    if type(inputs) is str:
+def _clean_inputs(inputs):
+    # This walks the inputs with an explicit stack instead of recursion, as
+    # collections can have tens of thousands of elements. Each container is
+    # cleaned in two steps: its scalar children are handled immediately and
+    # nested containers are scheduled, then (_FINISH) the results are merged.
+    ui_prefix = galaxy_ui_var()
+    root = [inputs]
+    stack = [(_VISIT, inputs, False, root, 0)]
+    while stack:
+        op, value, collapse_single, parent, slot = stack.pop()
+
+        if op is _FINISH:
+            parent[slot] = _finish_container(value, collapse_single)
+            continue
+        elif type(value) is list:
+            keys = None
+            children = value
+        elif type(value) is dict:
+            keys = []
+            children = []
+            for key, child in value.items():
+                # smash together nested dictionaries which are a consequence
+                # of UI nesting (merged later, in order, by _finish_container)
+                if key.startswith(ui_prefix):
+                    if type(child) is not dict:
+                        continue
+                    key = None
+                keys.append(key)
+                children.append(child)
+        else:
+            parent[slot] = _clean_scalar(value)
+            continue
+
+        # elements of a list are collapsed if they are a single-entry dict
+        collapse_children = keys is None
+        cleaned = []
+        nested = []
+        for idx, child in enumerate(children):
+            if type(child) is list or type(child) is dict:
+                cleaned.append(None)
+                nested.append((_VISIT, child, collapse_children, cleaned,
+                               idx))
+            else:
+                cleaned.append(_clean_scalar(child))
+
+        if nested:
+            stack.append((_FINISH, (keys, cleaned), collapse_single,
+                          parent, slot))
+            stack.extend(nested)
+        else:
+            parent[slot] = _finish_container((keys, cleaned),
+                                             collapse_single)
+
+    return root[0]
+
+
+def _clean_scalar(value):
+    if type(value) is str:
         # Galaxy seems to escape certain strings. For instance, the where
         # clause from filter-table filter-samples in moving pictures goes
         # from "[body-site]='gut'"
         # to "__dq____ob__body-site__cb__=__sq__gut__sq____dq__".
         # This needs to be undone, so we replace that here:
-        return galaxy_unesc(inputs)
-    elif type(inputs) is list:
-        res = [_clean_inputs(x, collapse_single=True) for x in inputs]
-        if res == [None]:
-            res = None
-        return res
-    elif type(inputs) is dict:
-        res = {}
-        for key, value in inputs.items():
-            # smash together nested dictionaries which are a consequence of
-            # UI nesting
-            if key.startswith(galaxy_ui_var()):
-                if type(value) is dict:
-                    res.update(_clean_inputs(value))
-                continue
-            res[key] = _clean_inputs(value)
-
-        if collapse_single and len(res) == 1:
-            return next(iter(res.values()))
+        return galaxy_unesc(value)
+    return value
+
+
+_VISIT = object()
+_FINISH = object()
+
+
+def _finish_container(container, collapse_single):
+    keys, cleaned = container
+    if keys is None:
+        if cleaned == [None]:
+            return None
+        return cleaned
+
+    res = {}
+    for key, value in zip(keys, cleaned):
+        if key is None:
+            res.update(value)
         else:
-            return res
+            res[key] = value
+
+    if collapse_single and len(res) == 1:
+        return next(iter(res.values()))
+    return res
+
+
+@root.command()
+@click.argument('path', type=click.Path(file_okay=True, dir_okay=False,
+                                        exists=True))
+def peek(path):
+    from q2galaxy.core.peek import peek as peek_archive
 
-    return inputs
+    try:
+        archive = peek_archive(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(json.dumps(archive._asdict()))
 
 
 @root.command()
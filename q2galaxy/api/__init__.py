@@ -6,115 +6,363 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 import os
+import json
+import time
+import shutil
+import tempfile
+import contextlib
+import collections
 
 import lxml.etree as _xml
 
+import qiime2
 import qiime2.sdk as _sdk
 
+import q2galaxy
 import q2galaxy.core.util as _util
 import q2galaxy.core.templaters as _templaters
 import q2galaxy.core.environment as _environment
 import q2galaxy.core.usage as _usage
+import q2galaxy.core.snapshot as _snapshot
+import q2galaxy.core.manifest as _manifest
+from q2galaxy.core.trace import span as _span
 from q2galaxy.api.usage import GalaxyRSTInstructionsUsage
 
 
 __all__ = ['template_action_iter', 'template_plugin_iter',
            'template_builtins_iter', 'template_all_iter', 'template_action',
            'template_plugin', 'template_builtins', 'template_all',
-           'GalaxyRSTInstructionsUsage', 'template_tool_conf']
+           'GalaxyRSTInstructionsUsage', 'template_tool_conf_iter',
+           'template_tool_conf', 'snapshot_iter', 'snapshot',
+           'template_merge_iter', 'template_merge']
 
 
 _SUITE_PREFIX = 'suite_qiime2__'
 
 
-def _template_dir_iter(directory):
+# Every created/updated/unchanged status carries how long it took
+# (elapsed_ms), how large the result is (bytes), and which plugin and action
+# it belongs to. Files are only replaced when their bytes change.
+def _make_status(path, is_existing, type_, start, nbytes, ids, changed=True):
+    if not is_existing:
+        status = 'created'
+    else:
+        status = 'updated' if changed else 'unchanged'
+    return {'status': status,
+            'type': type_, 'path': path,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+            'bytes': nbytes, **ids}
+
+
+def _template_dir_iter(directory, **ids):
+    start = time.perf_counter()
     if not os.path.exists(directory):
         os.mkdir(directory)
-        yield {'status': 'created', 'type': 'directory', 'path': directory}
+        yield _make_status(directory, False, 'directory', start, 0, ids)
 
 
-def _template_tool_iter(tool, path):
+def _template_tool_iter(tool, path, start, minify=False, **ids):
+    # `start` is taken before the tool was made, so that elapsed_ms covers
+    # building the tool as well as writing it
     is_existing = os.path.exists(path)
 
-    _util.write_tool(tool, path)
+    if _templaters.get_suite_macros() is not None:
+        tool.append(_templaters.make_macros_import())
+    nbytes, changed = _util.write_tool(tool, path, minify=minify)
 
-    if not is_existing:
-        yield {'status': 'created', 'type': 'file', 'path': path}
-    else:
-        yield {'status': 'updated', 'type': 'file', 'path': path}
+    yield _make_status(path, is_existing, 'file', start, nbytes, ids, changed)
 
 
-def template_action_iter(plugin, action, directory, metapackage=None):
-    meta = _environment.find_conda_meta(metapackage)
+def _template_macros_iter(macros, directory, minify=False, **ids):
+    start = time.perf_counter()
+    path = os.path.join(directory, _templaters.MACROS_FILENAME)
+    is_existing = os.path.exists(path)
 
-    filename = _templaters.make_tool_id(plugin.id, action.id) + '.xml'
-    filepath = os.path.join(directory, filename)
-    test_dir = os.path.join(directory, 'test-data', '')
+    nbytes, changed = _util.write_macros(macros, path, minify=minify)
 
-    yield from _template_dir_iter(test_dir)
-    yield from _usage.collect_test_data(action, test_dir)
+    yield _make_status(path, is_existing, 'file', start, nbytes, ids, changed)
 
-    tool = _templaters.make_tool(meta, plugin, action, test_dir)
-    yield from _template_tool_iter(tool, filepath)
 
+def _template_json_iter(data, path, **ids):
+    start = time.perf_counter()
+    is_existing = os.path.exists(path)
 
-def template_plugin_iter(plugin, directory, metapackage=None):
-    suite_name = _SUITE_PREFIX + plugin.id
-    suite_dir = os.path.join(directory, suite_name, '')
+    blob = (json.dumps(data, indent=2, sort_keys=True) + '\n').encode('utf-8')
+    nbytes, changed = _util.write_if_changed(path, lambda fh: fh.write(blob))
 
-    if plugin.actions:
-        yield from _template_dir_iter(suite_dir)
-    for action in plugin.actions.values():
-        yield from template_action_iter(plugin, action, suite_dir, metapackage)
+    yield _make_status(path, is_existing, 'file', start, nbytes, ids, changed)
 
 
-def template_builtins_iter(directory, distro=None, metapackage=None):
+def template_action_iter(plugin, action, directory, metapackage=None,
+                         minify=False):
     meta = _environment.find_conda_meta(metapackage)
 
-    suite_name = _SUITE_PREFIX + 'tools'
-    if distro is not None:
-        suite_name = _SUITE_PREFIX.replace(
-            'qiime2', f'qiime2_{distro}') + 'tools'
+    filename = _templaters.make_tool_id(plugin.id, action.id) + '.xml'
+    filepath = os.path.join(directory, filename)
+    test_dir = os.path.join(directory, 'test-data', '')
+    ids = {'plugin': plugin.id, 'action': action.id}
+
+    with _span(f'{plugin.id}.{action.id}', cat='api', **ids):
+        yield from _template_dir_iter(test_dir, **ids)
+        with _span('collect_test_data', cat='api'):
+            yield from _usage.collect_test_data(action, test_dir)
+
+        start = time.perf_counter()
+        with _span('make_tool', cat='api'):
+            tool = _templaters.make_tool(meta, plugin, action, test_dir)
+        yield from _template_tool_iter(tool, filepath, start, minify=minify,
+                                       **ids)
+
+        with _span('make_input_schema', cat='api'):
+            schema = _templaters.make_input_schema(plugin, action)
+        schema_path = os.path.join(
+            directory, _templaters.make_schema_filename(plugin, action))
+        yield from _template_json_iter(schema, schema_path, **ids)
+
+
+def template_plugin_iter(plugin, directory, metapackage=None, macros=False,
+                         minify=False, shard=None, containers=(),
+                         snapshot=None):
+    # With a loaded `snapshot`, `plugin` is one of its SnapshotPlugins
+    suite_name = _SUITE_PREFIX + plugin.id
     suite_dir = os.path.join(directory, suite_name, '')
-    yield from _template_dir_iter(suite_dir)
-
-    for tool_id, tool_maker in _templaters.BUILTIN_MAKERS.items():
-        if distro is not None:
-            tool_id = f'qiime2_{distro}' + tool_id[len('qiime2'):]
-        path = os.path.join(suite_dir, tool_id + '.xml')
-        tool = tool_maker(meta, tool_id)
-        yield from _template_tool_iter(tool, path)
-
-
-def template_all_iter(directory, distro=None, metapackage=None):
-    pm = _sdk.PluginManager()
-    for plugin in pm.plugins.values():
-        yield from template_plugin_iter(plugin, directory, metapackage)
-
-    yield from template_builtins_iter(directory, distro, metapackage)
-
-
-def template_action(plugin, action, directory, metapackage=None):
-    for _ in template_action_iter(plugin, action, directory, metapackage):
+    # `shard` is (index, count), see template_all_iter
+    actions = [action for action in plugin.actions.values()
+               if _manifest.in_shard(f'{plugin.id}.{action.id}', shard)]
+    if isinstance(plugin, _snapshot.SnapshotPlugin):
+        action_iter = _template_snapshot_action_iter
+    else:
+        action_iter = template_action_iter
+
+    with _span(plugin.id, cat='api', plugin=plugin.id), \
+            _snapshot_session(snapshot, metapackage), \
+            _templaters.container_images(containers), \
+            _templaters.suite_macros(macros) as suite:
+        if actions:
+            yield from _template_dir_iter(suite_dir, plugin=plugin.id,
+                                          action=None)
+        for action in actions:
+            yield from action_iter(plugin, action, suite_dir, metapackage,
+                                   minify=minify)
+        if suite:
+            yield from _template_macros_iter(suite.to_xml(), suite_dir,
+                                             minify, plugin=plugin.id,
+                                             action=None)
+        if containers:
+            yield from _template_containers_iter(directory, metapackage)
+
+
+def template_builtins_iter(directory, distro=None, metapackage=None,
+                           macros=False, minify=False, split=False,
+                           containers=(), snapshot=None):
+    suite_dir = os.path.join(directory, _builtins_suite_name(distro), '')
+    yield from _template_dir_iter(suite_dir, plugin='tools', action=None)
+
+    # the builtins share one index of the plugin registry
+    with _snapshot_session(snapshot, metapackage), \
+            _templaters.registry_index(), \
+            _templaters.container_images(containers), \
+            _templaters.suite_macros(macros) as suite:
+        meta = _environment.find_conda_meta(metapackage)
+        for tool_id, tool_maker in _templaters.iter_builtin_makers(split):
+            action_id = tool_id.rsplit('__', 1)[1]
+            tool_id = _distro_tool_id(tool_id, distro)
+            path = os.path.join(suite_dir, tool_id + '.xml')
+            with _span(tool_id, cat='api', tool_id=tool_id):
+                start = time.perf_counter()
+                tool = tool_maker(meta, tool_id)
+                yield from _template_tool_iter(tool, path, start, minify,
+                                               plugin='tools',
+                                               action=action_id)
+        if suite:
+            yield from _template_macros_iter(suite.to_xml(), suite_dir,
+                                             minify, plugin='tools',
+                                             action=None)
+        if containers:
+            yield from _template_containers_iter(directory, metapackage)
+
+
+def _template_containers_iter(directory, metapackage):
+    # at the top of the output, beside the suites which use the images
+    meta = _environment.find_conda_meta(metapackage)
+    manifest = _templaters.make_containers_manifest(
+        _templaters.get_container_images(), meta,
+        q2galaxy=q2galaxy.__version__, qiime2=qiime2.__version__)
+    path = os.path.join(directory, _templaters.CONTAINERS_FILENAME)
+    yield from _template_json_iter(manifest, path, plugin=None, action=None)
+
+
+def _builtins_suite_name(distro):
+    if distro is None:
+        return _SUITE_PREFIX + 'tools'
+    return _SUITE_PREFIX.replace('qiime2', f'qiime2_{distro}') + 'tools'
+
+
+def _distro_tool_id(tool_id, distro):
+    if distro is None:
+        return tool_id
+    return f'qiime2_{distro}' + tool_id[len('qiime2'):]
+
+
+# How many entries to list in the summary which ends template_all_iter
+_SUMMARY_TOP_N = 10
+
+
+def template_all_iter(directory, distro=None, metapackage=None,
+                      macros=False, minify=False, split=False, shard=None,
+                      containers=(), snapshot=None):
+    # With a `shard` of (index, count), only the actions which hash to
+    # `index` are templated (and the builtins only by the first shard), so
+    # that `count` machines can split the work. See template_merge_iter.
+    # With a loaded `snapshot`, its plugins are templated instead of those
+    # installed here.
+    def _statuses():
+        # every suite shares the images, and one containers manifest
+        with _snapshot_session(snapshot, metapackage), \
+                _templaters.container_images(containers):
+            if snapshot is None:
+                plugins = _sdk.PluginManager().plugins.values()
+            else:
+                plugins = snapshot.plugins.values()
+            for plugin in plugins:
+                yield from template_plugin_iter(plugin, directory,
+                                                metapackage, macros, minify,
+                                                shard)
+
+            if shard is None or shard[0] == 0:
+                yield from template_builtins_iter(directory, distro,
+                                                  metapackage, macros, minify,
+                                                  split)
+            if containers:
+                yield from _template_containers_iter(directory, metapackage)
+
+    yield from _manifested(
+        _summarized(_statuses()), directory, shard, distro=distro,
+        macros=macros, minify=minify, split=split,
+        containers=[image.image for image in containers])
+
+
+def _manifested(statuses, directory, shard=None, **options):
+    log = []
+    for status in statuses:
+        log.append(status)
+        yield status
+
+    start = time.perf_counter()
+    manifest = _manifest.make_manifest(directory, log, shard, **options)
+    yield from _template_manifest_iter(manifest, directory, start)
+
+
+def _template_manifest_iter(manifest, directory, start):
+    is_existing = os.path.exists(
+        os.path.join(directory, _manifest.MANIFEST_FILENAME))
+    path, nbytes, changed = _manifest.write_manifest(manifest, directory)
+    yield _make_status(path, is_existing, 'file', start, nbytes, {}, changed)
+
+
+def _summarized(statuses):
+    start = time.perf_counter()
+    per_action = collections.Counter()
+    tools = []
+
+    for status in statuses:
+        key = (status.get('plugin'), status.get('action'))
+        if key[1] is not None:
+            per_action[key] += status.get('elapsed_ms', 0)
+        # as in the manifest, macros.xml is not a tool
+        if status['path'].endswith('.xml') and key[1] is not None:
+            tools.append(status)
+        yield status
+
+    yield _make_summary(start, per_action, tools)
+
+
+def _make_summary(start, per_action, tools):
+    slowest = [{'plugin': plugin, 'action': action, 'elapsed_ms': round(ms, 3)}
+               for (plugin, action), ms
+               in per_action.most_common(_SUMMARY_TOP_N)]
+    largest = sorted(tools, key=lambda x: x['bytes'], reverse=True)
+    largest = [{'plugin': x['plugin'], 'action': x['action'],
+                'path': x['path'], 'bytes': x['bytes']}
+               for x in largest[:_SUMMARY_TOP_N]]
+
+    return {'status': 'summary', 'type': 'summary',
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+            'tools': len(tools),
+            'unchanged_tools': sum(x['status'] == 'unchanged' for x in tools),
+            'bytes': sum(x['bytes'] for x in tools),
+            'slowest_actions': slowest,
+            'largest_tools': largest}
+
+
+def template_action(plugin, action, directory, metapackage=None,
+                    minify=False):
+    for _ in template_action_iter(plugin, action, directory, metapackage,
+                                  minify):
         pass
 
 
-def template_plugin(plugin, directory, metapackage=None):
-    for _ in template_plugin_iter(plugin, directory, metapackage):
+def template_plugin(plugin, directory, metapackage=None, macros=False,
+                    minify=False, shard=None, containers=(), snapshot=None):
+    for _ in template_plugin_iter(plugin, directory, metapackage, macros,
+                                  minify, shard, containers, snapshot):
         pass
 
 
-def template_builtins(directory, distro=None, metapackage=None):
-    for _ in template_builtins_iter(directory, distro, metapackage):
+def template_builtins(directory, distro=None, metapackage=None, macros=False,
+                      minify=False, split=False, containers=(),
+                      snapshot=None):
+    for _ in template_builtins_iter(directory, distro, metapackage, macros,
+                                    minify, split, containers, snapshot):
         pass
 
 
-def template_all(directory, distro=None, metapackage=None):
-    for _ in template_all_iter(directory, distro, metapackage):
+def template_all(directory, distro=None, metapackage=None, macros=False,
+                 minify=False, split=False, shard=None, containers=(),
+                 snapshot=None):
+    for _ in template_all_iter(directory, distro, metapackage, macros,
+                               minify, split, shard, containers, snapshot):
         pass
 
 
-def template_tool_conf(directory, out_path, distro=None):
+def template_tool_conf_iter(directory, out_path, distro=None, split=False,
+                            manifest_dir=None, prune=False):
+    # The tools are listed under `directory`, where they will be installed.
+    # With `manifest_dir` (the output of `template all` or `template merge`),
+    # the toolbox is made from its manifest: no plugins are imported, and only
+    # the tools which were templated, and are still there, are listed. With
+    # `prune`, whatever else is in its suite directories is deleted first.
+    # Without it, the plugins installed here are listed.
+    if manifest_dir is None:
+        if prune:
+            raise ValueError("Only a manifest's directory can be pruned.")
+        toolbox = _make_plugin_toolbox(directory, distro, split)
+    else:
+        manifest = _manifest.load_manifest(manifest_dir)
+        options = manifest['options']
+        if ((distro is not None and distro != options.get('distro'))
+                or (split and not options.get('split'))):
+            raise ValueError(f"{manifest_dir} was templated with"
+                             f" distro={options.get('distro')!r} and"
+                             f" split={options.get('split')!r}.")
+        if prune:
+            for relpath in _manifest.stale_paths(manifest, manifest_dir):
+                yield _prune(
+                    os.path.join(manifest_dir, *relpath.split('/')))
+        toolbox = _make_toolbox(manifest, manifest_dir, directory)
+
+    start = time.perf_counter()
+    is_existing = os.path.exists(out_path)
+    _xml.indent(toolbox, ' ' * 4)
+    blob = _xml.tostring(toolbox, pretty_print=True, encoding='utf-8',
+                         xml_declaration=True)
+    nbytes, changed = _util.write_if_changed(out_path,
+                                             lambda fh: fh.write(blob))
+    yield _make_status(out_path, is_existing, 'file', start, nbytes, {},
+                       changed)
+
+
+def _make_plugin_toolbox(directory, distro, split):
     toolbox = _util.XMLNode('toolbox')
 
     section = _util.XMLNode('section', id='getext', name='Get Data')
@@ -124,14 +372,9 @@ def template_tool_conf(directory, out_path, distro=None):
     section = _util.XMLNode('section', id='qiime2__tools',
                             name='QIIME 2 Tools')
 
-    suite_name = _SUITE_PREFIX + 'tools'
-    if distro is not None:
-        suite_name = _SUITE_PREFIX.replace(
-            'qiime2', f'qiime2_{distro}') + 'tools'
-    suite_dir = os.path.join(directory, suite_name)
-    for tool_id in _templaters.BUILTIN_MAKERS:
-        if distro is not None:
-            tool_id = f'qiime2_{distro}' + tool_id[len('qiime2'):]
+    suite_dir = os.path.join(directory, _builtins_suite_name(distro))
+    for tool_id, _ in _templaters.iter_builtin_makers(split):
+        tool_id = _distro_tool_id(tool_id, distro)
         path = os.path.join(suite_dir, tool_id + '.xml')
         section.append(_util.XMLNode('tool', file=path))
 
@@ -151,7 +394,239 @@ def template_tool_conf(directory, out_path, distro=None):
 
         toolbox.append(section)
 
-    with open(out_path, 'wb') as fh:
-        _xml.indent(toolbox, ' ' * 4)
-        fh.write(_xml.tostring(toolbox, pretty_print=True, encoding='utf-8',
-                               xml_declaration=True))
+    return toolbox
+
+
+def _make_toolbox(manifest, directory, install_dir):
+    suites = collections.defaultdict(list)
+    for tool in manifest['tools']:
+        if os.path.exists(os.path.join(directory, *tool['path'].split('/'))):
+            suites[tool['plugin']].append(tool)
+
+    toolbox = _util.XMLNode('toolbox')
+
+    section = _util.XMLNode('section', id='getext', name='Get Data')
+    section.append(_util.XMLNode('tool', file='data_source/upload.xml'))
+    toolbox.append(section)
+
+    # the builtins in the order they were made
+    order = {path: idx for idx, path in enumerate(manifest['builtins'])}
+    builtins = sorted(suites.pop('tools', []),
+                      key=lambda x: (order.get(x['path'], len(order)),
+                                     x['path']))
+    section = _util.XMLNode('section', id='qiime2__tools',
+                            name='QIIME 2 Tools')
+    for tool in builtins:
+        section.append(_util.XMLNode(
+            'tool', file=os.path.join(install_dir, *tool['path'].split('/'))))
+    toolbox.append(section)
+
+    for plugin_id in sorted(suites):
+        plugin_name = plugin_id.replace('_', '-')
+        section = _util.XMLNode('section', id=_SUITE_PREFIX + plugin_id,
+                                name=f'QIIME 2 {plugin_name}')
+        for tool in sorted(suites[plugin_id], key=lambda x: x['action']):
+            path = os.path.join(install_dir, *tool['path'].split('/'))
+            section.append(_util.XMLNode('tool', file=path))
+        toolbox.append(section)
+
+    return toolbox
+
+
+def _prune(path):
+    start = time.perf_counter()
+    is_dir = os.path.isdir(path)
+    nbytes = _usage.path_size(path)
+    if is_dir:
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+    return {'status': 'pruned', 'type': 'directory' if is_dir else 'file',
+            'path': path,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3),
+            'bytes': nbytes}
+
+
+def template_tool_conf(directory, out_path, distro=None, split=False,
+                       manifest_dir=None, prune=False):
+    for _ in template_tool_conf_iter(directory, out_path, distro, split,
+                                     manifest_dir, prune):
+        pass
+
+
+def snapshot_iter(out_path):
+    start = time.perf_counter()
+    meta = _environment.find_conda_meta()
+
+    pm = _sdk.PluginManager()
+    plugins = []
+    with tempfile.TemporaryDirectory(prefix='q2galaxy-snapshot-') as tmp:
+        for plugin in sorted(pm.plugins.values(), key=lambda x: x.id):
+            with _span(plugin.id, cat='api', plugin=plugin.id):
+                plugins.append(_snapshot_plugin(
+                    plugin, os.path.join(tmp, plugin.id)))
+
+    with _span('registry', cat='api'), \
+            _templaters.registry_index() as index:
+        registry = _snapshot.encode_index(index)
+        # every project a tool's requirements may name
+        projects = _templaters.project_names(
+            [*pm.plugins.values(), *_registry_plugins(index)])
+
+    snapshot = _snapshot.make_snapshot(
+        plugins, registry, _environment.record_conda_meta(meta, projects),
+        q2galaxy=q2galaxy.__version__, qiime2=qiime2.__version__)
+
+    is_existing = os.path.exists(out_path)
+    nbytes, changed = _snapshot.write_snapshot(snapshot, out_path)
+    yield _make_status(out_path, is_existing, 'file', start, nbytes, {},
+                       changed)
+
+
+def _snapshot_plugin(plugin, directory):
+    actions = []
+    for action in plugin.actions.values():
+        # each action's own example data, as actions are templated by shard
+        test_dir = os.path.join(directory, action.id, '')
+        os.makedirs(test_dir)
+        for _ in _usage.collect_test_data(action, test_dir):
+            pass
+        body = _templaters.make_tool_body(plugin, action, test_dir)
+        actions.append(_snapshot.encode_action(
+            action, body, _templaters.make_input_schema(plugin, action),
+            _snapshot.encode_dir(test_dir)))
+    return _snapshot.encode_plugin(plugin, actions)
+
+
+def _registry_plugins(index):
+    for record in index.records:
+        yield record.plugin
+        for pairs in (index.importable, index.exportable):
+            for _, plugin in pairs[record.semantic_type]:
+                yield plugin
+
+
+@contextlib.contextmanager
+def _snapshot_session(snapshot, metapackage):
+    # The snapshot's environment and registry stand in for this one's
+    if snapshot is None:
+        yield
+        return
+
+    meta = _environment.RecordedCondaMeta(
+        snapshot.environment['packages'], snapshot.environment['installed'],
+        metapackage=metapackage)
+    with _environment.conda_environment(meta), \
+            _templaters.registry_index(snapshot.registry):
+        yield
+
+
+def _template_snapshot_action_iter(plugin, action, directory,
+                                   metapackage=None, minify=False):
+    # As template_action_iter, for a SnapshotPlugin's SnapshotAction
+    meta = _environment.find_conda_meta(metapackage)
+
+    filename = _templaters.make_tool_id(plugin.id, action.id) + '.xml'
+    filepath = os.path.join(directory, filename)
+    test_dir = os.path.join(directory, 'test-data', '')
+    ids = {'plugin': plugin.id, 'action': action.id}
+
+    with _span(f'{plugin.id}.{action.id}', cat='api', **ids):
+        yield from _template_dir_iter(test_dir, **ids)
+        yield from _template_files_iter(action.test_data, test_dir, **ids)
+
+        start = time.perf_counter()
+        tool = _templaters.assemble_tool(meta, plugin, action,
+                                         _snapshot.decode_body(action.body))
+        yield from _template_tool_iter(tool, filepath, start, minify=minify,
+                                       **ids)
+
+        schema_path = os.path.join(
+            directory, _templaters.make_schema_filename(plugin, action))
+        yield from _template_json_iter(action.schema, schema_path, **ids)
+
+
+def _template_files_iter(files, directory, **ids):
+    for relpath, blob in files.items():
+        start = time.perf_counter()
+        path = os.path.join(directory, *relpath.split('/'))
+        is_existing = os.path.exists(path)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = _snapshot.decode_file(blob)
+        nbytes, changed = _util.write_if_changed(
+            path, lambda fh: fh.write(data))
+        yield _make_status(path, is_existing, 'file', start, nbytes, ids,
+                           changed)
+
+
+def snapshot(out_path):
+    for _ in snapshot_iter(out_path):
+        pass
+
+
+def template_merge_iter(directory, shard_dirs):
+    # Combines the output of every shard of `template all --shard` into
+    # `directory`. Each shard has its own suite macros and test data, so
+    # macros.xml files are merged (their names are content hashes) and
+    # test data written by several shards is taken from the last of them.
+    manifests = [_manifest.load_manifest(d) for d in shard_dirs]
+    merged = _manifest.merge_manifests(manifests)
+    minify = merged['options'].get('minify', False)
+
+    tool_ids = {tool['path']: {'plugin': tool['plugin'],
+                               'action': tool['action']}
+                for tool in merged['tools']}
+
+    def _statuses():
+        suites = collections.defaultdict(list)
+        for shard_dir, manifest in sorted(zip(shard_dirs, manifests),
+                                          key=lambda x: x[1]['shard'][0]):
+            for relpath in manifest['files']:
+                src = os.path.join(shard_dir, *relpath.split('/'))
+                if os.path.basename(relpath) == _templaters.MACROS_FILENAME:
+                    suites[os.path.dirname(relpath)].append(src)
+                    continue
+                dst = os.path.join(directory, *relpath.split('/'))
+                yield from _copy_iter(src, dst, **tool_ids.get(
+                    relpath, {'plugin': None, 'action': None}))
+
+        # as written by template_*_iter, whitespace aside
+        parser = _xml.XMLParser(remove_blank_text=True)
+        for suite, paths in sorted(suites.items()):
+            macros = _templaters.SuiteMacros()
+            for path in paths:
+                macros.update_from_xml(_xml.parse(path, parser).getroot())
+            yield from _template_macros_iter(
+                macros.to_xml(), os.path.join(directory, suite), minify,
+                plugin=None, action=None)
+
+    yield from _summarized(_statuses())
+    yield from _template_manifest_iter(merged, directory, time.perf_counter())
+
+
+def _copy_iter(src, dst, **ids):
+    start = time.perf_counter()
+    is_existing = os.path.exists(dst)
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    # collections are saved as a directory
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, dirs_exist_ok=True)
+        changed = True
+    else:
+        _, changed = _util.write_if_changed(
+            dst, lambda fh: _copy_file(src, fh))
+    yield _make_status(dst, is_existing, 'file', start, _usage.path_size(dst),
+                       ids, changed)
+
+
+def _copy_file(src, fh):
+    with open(src, 'rb') as src_fh:
+        shutil.copyfileobj(src_fh, fh)
+    return fh.tell()
+
+
+def template_merge(directory, shard_dirs):
+    for _ in template_merge_iter(directory, shard_dirs):
+        pass
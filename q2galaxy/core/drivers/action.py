@@ -11,27 +11,61 @@ import sys
 import qiime2
 import qiime2.sdk as sdk
 
-from q2galaxy.core.util import get_mystery_stew
+from q2galaxy.core.peek import peek
 from q2galaxy.core.drivers.stdio import (
     error_handler, stdio_files, GALAXY_TRIMMED_STRING_LEN)
+from q2galaxy.core.drivers.metrics import collect_metrics, phase
+from q2galaxy.core.drivers.profile import profile_job
+from q2galaxy.core.drivers.cache import get_result_cache, make_memo_key
+from q2galaxy.core.drivers.schema import validate_inputs
 
 
-def action_runner(plugin_id, action_id, inputs):
+def action_runner(plugin_id, action_id, inputs, schema=None):
     # Each helper below is decorated to accept stdout and stderr, the goal is
     # to catch issues and promote the error message to the start of stdout and
     # stderr so that Galaxy's misc_info block will be the most relevant info.
     # Otherwise, you tend to end up with a traceback or the start of stdout
     # for noisy actions. To preserve stdout and stderr, we do want to log them
     # and then emit them at the end after writing out the relevant error first
-    with stdio_files() as stdio:
-        action = _get_action(plugin_id, action_id,
-                             _stdio=stdio)
-        action_kwargs = _convert_arguments(action.signature, inputs,
-                                           _stdio=stdio)
-        results = _execute_action(action, action_kwargs,
-                                  _stdio=stdio)
-        _save_results(results,
-                      _stdio=stdio)
+    # The metrics footer is printed last, after the replayed stdio.
+    with collect_metrics(plugin_id, action_id), \
+            profile_job(plugin_id, action_id), stdio_files() as stdio:
+        if schema is not None:
+            with phase('validate_inputs'):
+                _validate_inputs(schema, inputs,
+                                 _stdio=stdio)
+        with phase('get_action'):
+            action = _get_action(plugin_id, action_id,
+                                 _stdio=stdio)
+
+        cache = get_result_cache()
+        if cache is not None:
+            with phase('cache_lookup'):
+                memo_key = _get_memo_key(plugin_id, action_id,
+                                         action.signature, inputs,
+                                         _stdio=stdio)
+                restored = _restore_results(cache, memo_key,
+                                            _stdio=stdio)
+            if restored:
+                return
+
+        with phase('validate_archives'):
+            _validate_archives(action.signature, inputs,
+                               _stdio=stdio)
+        with phase('load_inputs'):
+            action_kwargs = _convert_arguments(action.signature, inputs,
+                                               _stdio=stdio)
+        with phase('execute'):
+            results = _execute_action(action, action_kwargs,
+                                      _stdio=stdio)
+        with phase('save_outputs'):
+            locations = _save_results(results,
+                                      _stdio=stdio)
+
+        if cache is not None:
+            with phase('cache_store'):
+                _store_results(cache, memo_key, locations,
+                               _stdio=stdio)
 
 
 def get_version(plugin_id):
@@ -41,12 +75,19 @@ def get_version(plugin_id):
 
 def _get_plugin(plugin_id):
     if plugin_id == 'mystery_stew':
+        # only for testing, and q2galaxy.core.util is heavy to import
+        from q2galaxy.core.util import get_mystery_stew
         return get_mystery_stew()
     else:
         pm = sdk.PluginManager()
         return pm.get_plugin(id=plugin_id)
 
 
+@error_handler(header="The inputs provided to this tool are invalid:\n")
+def _validate_inputs(schema, inputs):
+    validate_inputs(schema, inputs)
+
+
 @error_handler(header="Unexpected error finding the action in q2galaxy: ")
 def _get_action(plugin_id, action_id):
     plugin = _get_plugin(plugin_id)
@@ -55,6 +96,39 @@ def _get_action(plugin_id, action_id):
     return action
 
 
+@error_handler(header="An input was not usable by this action:\n")
+def _validate_archives(signature, inputs):
+    # Every archive is peeked before anything is loaded so that an unusable
+    # input is reported immediately instead of after extracting the others.
+    for k, v in inputs.items():
+        if v is None:
+            continue
+
+        if k in signature.inputs:
+            type_ = signature.inputs[k].qiime_type
+            if qiime2.sdk.util.is_collection_type(type_):
+                type_ = type_.fields[0]
+                sources = [x['source_path'] for x in v]
+            else:
+                sources = [v['source_path']]
+
+            for source in sources:
+                if source is None:
+                    continue
+                archive = peek(source)
+                if sdk.parse_type(archive.type) <= type_:
+                    continue
+                raise TypeError(f"{k!r} was given {archive.type}, but"
+                                f" requires {type_}.")
+
+        elif (k in signature.parameters and qiime2.sdk.util.is_metadata_type(
+                signature.parameters[k].qiime_type)):
+            entries = [v] if type(v) is dict else v
+            for entry in entries:
+                if entry.get('type') == 'qza':
+                    peek(entry['source']['source_path'])
+
+
 @error_handler(header="Unexpected error loading arguments in q2galaxy: ")
 def _convert_arguments(signature, inputs):
     processed_inputs = {}
@@ -154,6 +228,7 @@ def _execute_action(action, action_kwargs):
 
 @error_handler(header="Unexpected error saving results in q2galaxy: ")
 def _save_results(results):
+    locations = []
     for name, result in zip(results._fields, results):
         # For ResultCollections we want to avoid writing an order file because
         # galaxy will interpret it as just another dataset in the collection
@@ -162,8 +237,41 @@ def _save_results(results):
             location = result.save_unordered(name)
         else:
             location = result.save(name)
+        locations.append(location)
         print(f"Saved {result.type} to: {location}", file=sys.stdout)
 
+    return locations
+
+
+@error_handler(header="Unexpected error computing the cache key in q2galaxy: ")
+def _get_memo_key(plugin_id, action_id, signature, inputs):
+    version = get_version(plugin_id)
+    collections = [name for name, spec in signature.inputs.items()
+                   if spec.qiime_type.name == 'Collection']
+    return make_memo_key(plugin_id, action_id, version, inputs, collections)
+
+
+@error_handler(header="Unexpected error restoring results in q2galaxy: ")
+def _restore_results(cache, memo_key):
+    entry = cache.lookup(memo_key)
+    if entry is None:
+        return False
+
+    print(f'｢cached: {memo_key}｣', file=sys.stdout)
+    for location in cache.restore(entry, os.getcwd()):
+        print(f"Restored previous result to: {location}", file=sys.stdout)
+    return True
+
+
+@error_handler(header="Unexpected error caching results in q2galaxy: ")
+def _store_results(cache, memo_key, locations):
+    # Nothing about the cache (full, unwritable, or otherwise) should fail an
+    # otherwise good job
+    try:
+        cache.store(memo_key, locations)
+    except Exception as e:
+        print(f"Unable to cache results: {e!r}", file=sys.stderr)
+
 
 def _convert_metadata(input_, value, param):
     if not value:
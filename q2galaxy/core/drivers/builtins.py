@@ -7,37 +7,56 @@
 # ----------------------------------------------------------------------------
 import os
 import sys
+import types
+import shutil
 import tempfile
-import distutils
+import functools
 
 import qiime2
 import qiime2.sdk
 import qiime2.util
 
+from q2galaxy.core.peek import peek
 from q2galaxy.core.drivers.stdio import error_handler, stdio_files
+from q2galaxy.core.drivers.scratch import get_scratch_dir
+from q2galaxy.core.drivers.metrics import collect_metrics, phase
+from q2galaxy.core.drivers.profile import profile_job
+
 
 # Verify that the types the tool relies on are present and use this information
 # in q2galaxy/core/templaters/__init__.py to determine whether or not to render
 # the tool.
 #
-# We do these imports here because they are needed for import_fastq_data, and
-# we set this variable because the presence/absence of these types is needed in
-# templaters init.
-IMPORT_FASTQ = True
+# These are imported on first use, rather than with this module, as importing
+# q2_types is slow and only import_fastq_data needs it.
+@functools.lru_cache(maxsize=None)
+def _fastq_types():
+    try:
+        from q2_types.per_sample_sequences import (
+            CasavaOneEightSingleLanePerSampleDirFmt, SequencesWithQuality,
+            PairedEndSequencesWithQuality)
+        from q2_types.sample_data import SampleData
+    except Exception:
+        return None
+
+    return types.SimpleNamespace(
+        CasavaOneEightSingleLanePerSampleDirFmt=(
+            CasavaOneEightSingleLanePerSampleDirFmt),
+        SequencesWithQuality=SequencesWithQuality,
+        PairedEndSequencesWithQuality=PairedEndSequencesWithQuality,
+        SampleData=SampleData)
 
-try:
-    from q2_types.per_sample_sequences import (
-        CasavaOneEightSingleLanePerSampleDirFmt, SequencesWithQuality,
-        PairedEndSequencesWithQuality)
-    from q2_types.sample_data import SampleData
-except Exception:
-    IMPORT_FASTQ = False
+
+def import_fastq_available():
+    return _fastq_types() is not None
 
 
 def builtin_runner(action_id, inputs):
-    with stdio_files() as stdio:
-        tool = _get_tool(action_id,
-                         _stdio=stdio)
+    with collect_metrics('tools', action_id), \
+            profile_job('tools', action_id), stdio_files() as stdio:
+        with phase('get_tool'):
+            tool = _get_tool(action_id,
+                             _stdio=stdio)
         tool(inputs, stdio=stdio)
 
 
@@ -57,25 +76,33 @@ def _get_tool(action_id):
 
 
 def import_data(inputs, stdio):
-    type_, format_, files_to_move = _import_get_args(inputs,
-                                                     _stdio=stdio)
-    artifact = _import_name_data(type_, format_, files_to_move,
-                                 _stdio=stdio)
-    _import_save(artifact,
-                 _stdio=stdio)
+    with phase('get_args'):
+        type_, format_, files_to_move = _import_get_args(inputs,
+                                                         _stdio=stdio)
+    with phase('import'):
+        artifact = _import_name_data(type_, format_, files_to_move,
+                                     _stdio=stdio)
+    with phase('save_outputs'):
+        _import_save(artifact,
+                     _stdio=stdio)
 
 
 def import_fastq_data(inputs, stdio):
-    paired = _is_paired(inputs, _stdio=stdio)
+    with phase('get_args'):
+        paired = _is_paired(inputs, _stdio=stdio)
 
-    type_ = SampleData[PairedEndSequencesWithQuality] if paired \
-        else SampleData[SequencesWithQuality]
-    format_ = CasavaOneEightSingleLanePerSampleDirFmt
-    files_to_move = _import_fastq_get_files_to_move(
-        inputs, paired, _stdio=stdio)
+        q2_types = _fastq_types()
+        type_ = q2_types.SampleData[q2_types.PairedEndSequencesWithQuality] \
+            if paired else q2_types.SampleData[q2_types.SequencesWithQuality]
+        format_ = q2_types.CasavaOneEightSingleLanePerSampleDirFmt
+        files_to_move = _import_fastq_get_files_to_move(
+            inputs, paired, _stdio=stdio)
 
-    artifact = _import_name_data(type_, format_, files_to_move, _stdio=stdio)
-    _import_save(artifact, _stdio=stdio)
+    with phase('import'):
+        artifact = _import_name_data(type_, format_, files_to_move,
+                                     _stdio=stdio)
+    with phase('save_outputs'):
+        _import_save(artifact, _stdio=stdio)
 
 
 @error_handler(header='Unexpected error determining if data is paired: ')
@@ -161,25 +188,40 @@ def _import_name_data(type_, format_, files_to_move):
         path = files_to_move[0][1]
         return qiime2.Artifact.import_data(type_, path, view_type=format_)
 
-    with tempfile.TemporaryDirectory(prefix='q2galaxy-import',
-                                     dir=os.getcwd()) as dir_:
+    with tempfile.TemporaryDirectory(
+            prefix='q2galaxy-import',
+            dir=_import_staging_dir(files_to_move)) as dir_:
         for src, dst in files_to_move:
             qiime2.util.duplicate(src, os.path.join(dir_, dst))
         return qiime2.Artifact.import_data(type_, dir_, view_type=format_)
 
 
+def _import_staging_dir(files_to_move):
+    # The uploads only need new names, so stage them on their own filesystem
+    # (preferring scratch), where duplicate() hard-links instead of copying
+    devices = {os.stat(src).st_dev for src, _ in files_to_move}
+    candidates = (get_scratch_dir(), os.getcwd())
+    for dir_ in candidates:
+        if {os.stat(dir_).st_dev} == devices and os.access(dir_, os.W_OK):
+            return dir_
+    return candidates[0]
+
+
 @error_handler(header='Unexpected error saving QZA: ')
 def _import_save(artifact):
     artifact.save('imported_data')
 
 
 def export_data(inputs, stdio):
-    output_format, result = _export_get_args(inputs,
-                                             _stdio=stdio)
-    output_format = _export_transform(result, output_format,
-                                      _stdio=stdio)
-    _export_save(output_format,
-                 _stdio=stdio)
+    with phase('load_inputs'):
+        output_format, result = _export_get_args(inputs,
+                                                 _stdio=stdio)
+    with phase('transform'):
+        output_format = _export_transform(result, output_format,
+                                          _stdio=stdio)
+    with phase('save_outputs'):
+        _export_save(output_format,
+                     _stdio=stdio)
 
 
 @error_handler(header='Unexpected error collecting arguments: ')
@@ -192,6 +234,9 @@ def _export_get_args(inputs):
     else:
         output_format = qiime2.sdk.parse_format(output_format)
 
+    # fail before extracting anything if this isn't an archive at all
+    peek(input_)
+
     # TODO: Result.load will die if the format is unknown, there may be a
     # better way to handle unkown /data/ directories
     result = qiime2.sdk.Result.load(input_)
@@ -213,7 +258,7 @@ def _export_save(format_obj):
     if format_obj is None:
         pass  # from default output_format in _export_transform (return None)
     elif format_obj.path.is_dir():
-        distutils.dir_util.copy_tree(str(format_obj), os.getcwd())
+        shutil.copytree(str(format_obj), os.getcwd(), dirs_exist_ok=True)
     else:
         qiime2.util.duplicate(str(format_obj), format_obj.path.name)
 
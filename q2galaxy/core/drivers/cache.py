@@ -0,0 +1,234 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import contextlib
+
+import qiime2
+
+import q2galaxy
+from q2galaxy.core.peek import peek
+from q2galaxy.core.drivers.settings import parse_size
+
+# Galaxy's job cache is keyed on dataset ids, but the same QIIME 2 artifact
+# can be behind many datasets (re-uploads, copies between histories). This
+# store is keyed on what actually determines the result instead: the action,
+# the plugin version, the UUIDs of the input artifacts, and the parameters.
+CACHE_DIR_ENV = 'Q2GALAXY_RESULT_CACHE'
+CACHE_SIZE_ENV = 'Q2GALAXY_RESULT_CACHE_SIZE'
+DEFAULT_CACHE_SIZE = 50 * 1024 ** 3
+
+_COMPLETE = '.complete'
+# The running size of the complete entries, so that a store only walks the
+# whole cache when it has grown past its limit. Entries removed by hand make
+# it an overestimate, which the next eviction corrects.
+_TOTAL = '.total'
+_LOCK = '.lock'
+# An eviction makes this much room (of max_bytes), so that a full cache isn't
+# walked again by the very next store
+_LOW_WATER = 0.9
+
+
+def get_result_cache():
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        return None
+
+    max_bytes = os.environ.get(CACHE_SIZE_ENV)
+    if max_bytes:
+        max_bytes = parse_size(max_bytes)
+    else:
+        max_bytes = DEFAULT_CACHE_SIZE
+
+    return ResultCache(root, max_bytes)
+
+
+def make_memo_key(plugin_id, action_id, version, inputs, collections=()):
+    # `collections` names the inputs which are ResultCollections, whose keys
+    # come from the datasets' names (see _convert_arguments). Any other
+    # dataset is identified by its content alone, whatever it is called.
+    record = {
+        'plugin': plugin_id,
+        'action': action_id,
+        'version': version,
+        'qiime2': qiime2.__version__,
+        'q2galaxy': q2galaxy.__version__,
+        'inputs': {k: _normalize(v, named=k in collections)
+                   for k, v in inputs.items()},
+    }
+    blob = json.dumps(record, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf8')).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, key):
+        entry = self._entry(key)
+        marker = os.path.join(entry, _COMPLETE)
+        if not os.path.exists(marker):
+            return None
+        # the marker's mtime doubles as the last-used time for eviction
+        os.utime(marker)
+        return entry
+
+    def restore(self, entry, destination):
+        locations = []
+        for name in sorted(os.listdir(entry)):
+            if name == _COMPLETE:
+                continue
+            src = os.path.join(entry, name)
+            dst = os.path.join(destination, name)
+            _link_tree(src, dst)
+            locations.append(dst)
+        return locations
+
+    def store(self, key, locations):
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+
+        staging = os.path.join(self.root, f'.tmp-{key}-{os.getpid()}')
+        os.makedirs(staging)
+        try:
+            for location in locations:
+                location = str(location)
+                name = os.path.basename(os.path.normpath(location))
+                _link_tree(location, os.path.join(staging, name))
+            with open(os.path.join(staging, _COMPLETE), 'w'):
+                pass
+            # another job may have raced us here, in which case theirs wins
+            os.rename(staging, entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.exists(entry):
+                raise
+            return
+
+        with self._locked():
+            total = self._read_total()
+            if total is not None:
+                total += _tree_size(entry)
+            if total is None or total > self.max_bytes:
+                total = self.evict()
+            self._write_total(total)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # jobs on other nodes may share the cache
+        with open(os.path.join(self.root, _LOCK), 'a') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _read_total(self):
+        try:
+            with open(os.path.join(self.root, _TOTAL)) as fh:
+                return int(fh.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_total(self, total):
+        path = os.path.join(self.root, _TOTAL)
+        tmp_path = f'{path}.{os.getpid()}'
+        with open(tmp_path, 'w') as fh:
+            fh.write(str(total))
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        # returns the size of what is left
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            entry = os.path.join(self.root, name)
+            marker = os.path.join(entry, _COMPLETE)
+            if name.startswith('.') or not os.path.exists(marker):
+                continue
+            size = _tree_size(entry)
+            entries.append((os.path.getmtime(marker), size, entry))
+            total += size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes * _LOW_WATER:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        return total
+
+
+def _normalize(value, named=False):
+    if type(value) is dict:
+        if 'source_path' in value:
+            return _fingerprint(value, named)
+        return {k: _normalize(v, named) for k, v in value.items()}
+    elif type(value) is list:
+        return [_normalize(v, named) for v in value]
+    return value
+
+
+def _fingerprint(dataset, named):
+    path = dataset['source_path']
+    if path is None:
+        return None
+
+    # the staged filename (Galaxy's element identifier) is a
+    # ResultCollection's key, otherwise it is only a label
+    fingerprint = {}
+    if named and dataset.get('staging_path') is not None:
+        fingerprint['name'] = os.path.basename(dataset['staging_path'])
+
+    try:
+        fingerprint['uuid'] = peek(path).uuid
+    except ValueError:
+        # not an archive (e.g. metadata TSV), so its bytes are the identity
+        fingerprint['sha256'] = _file_digest(path)
+
+    return fingerprint
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _link_tree(src, dst):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=_link_or_copy)
+    else:
+        _link_or_copy(src, dst)
+
+
+def _tree_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
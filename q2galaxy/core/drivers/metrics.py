@@ -0,0 +1,144 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import resource
+import contextlib
+
+from q2galaxy.core.trace import span
+
+# Each phase of a job (loading inputs, computing, saving outputs...) records
+# its wall time, CPU time, I/O, and the peak RSS of the job so far (not of
+# the phase alone, the kernel only keeps one high-water mark). These are
+# summarized in a footer at the end of stdout, and written as JSON to this
+# file (when set) for a Galaxy job metrics plugin or other collector to pick
+# up. It is opt-in as anything left in the working directory may be collected
+# as an output.
+METRICS_FILE_ENV = 'Q2GALAXY_METRICS_FILE'
+
+# ru_maxrss is in KiB on Linux, but bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+_CURRENT_METRICS = None
+
+
+class JobMetrics:
+    def __init__(self, plugin_id, action_id):
+        self.plugin_id = plugin_id
+        self.action_id = action_id
+        self.phases = []
+        self.status = 'running'
+        self._start = _sample()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = _sample()
+        try:
+            with span(name, cat='drivers', plugin=self.plugin_id,
+                      action=self.action_id):
+                yield
+        finally:
+            self.phases.append({'phase': name, **_delta(start, _sample())})
+
+    def total(self):
+        return {'phase': 'total', **_delta(self._start, _sample())}
+
+    def to_dict(self):
+        return {'plugin': self.plugin_id,
+                'action': self.action_id,
+                'status': self.status,
+                'phases': self.phases,
+                'total': self.total()}
+
+    def footer(self):
+        lines = []
+        for record in [*self.phases, self.total()]:
+            lines.append(
+                f"｢{record['phase']}: wall {record['wall_s']:.2f}s,"
+                f" cpu {record['cpu_s'] + record['child_cpu_s']:.2f}s,"
+                f" peak rss so far"
+                f" {_pretty_bytes(record['peak_rss_so_far_bytes'])},"
+                f" read {_pretty_bytes(record['read_bytes'])},"
+                f" written {_pretty_bytes(record['written_bytes'])}｣")
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def collect_metrics(plugin_id, action_id):
+    global _CURRENT_METRICS
+    metrics = JobMetrics(plugin_id, action_id)
+    _CURRENT_METRICS = metrics
+    try:
+        yield metrics
+        metrics.status = 'ok'
+    except BaseException:
+        metrics.status = 'error'
+        raise
+    finally:
+        _CURRENT_METRICS = None
+        print(metrics.footer(), file=sys.stdout, flush=True)
+
+        path = os.environ.get(METRICS_FILE_ENV)
+        if path:
+            with open(path, 'w') as fh:
+                json.dump(metrics.to_dict(), fh, indent=2)
+                fh.write('\n')
+
+
+def phase(name):
+    if _CURRENT_METRICS is None:
+        return contextlib.nullcontext()
+    return _CURRENT_METRICS.phase(name)
+
+
+def _sample():
+    self_ = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read, written = _io_counters(self_)
+    return {
+        'wall': time.perf_counter(),
+        'cpu': self_.ru_utime + self_.ru_stime,
+        'child_cpu': children.ru_utime + children.ru_stime,
+        'maxrss': max(self_.ru_maxrss, children.ru_maxrss) * _MAXRSS_UNIT,
+        'read': read,
+        'written': written,
+    }
+
+
+def _delta(start, end):
+    return {
+        'wall_s': end['wall'] - start['wall'],
+        'cpu_s': end['cpu'] - start['cpu'],
+        'child_cpu_s': end['child_cpu'] - start['child_cpu'],
+        # ru_maxrss only ever grows, so this includes earlier phases
+        'peak_rss_so_far_bytes': end['maxrss'],
+        'read_bytes': end['read'] - start['read'],
+        'written_bytes': end['written'] - start['written'],
+    }
+
+
+def _io_counters(rusage):
+    # rchar/wchar count all bytes passed through read/write (including those
+    # satisfied by the page cache or a network filesystem)
+    try:
+        with open('/proc/self/io') as fh:
+            counters = dict(line.split(': ')
+                            for line in fh.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return rusage.ru_inblock * 512, rusage.ru_oublock * 512
+
+
+def _pretty_bytes(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(n) < 1024:
+            return f'{n:.1f}{unit}' if unit != 'B' else f'{n}B'
+        n /= 1024
+    return f'{n:.1f}TiB'
@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import io
+import os
+import contextlib
+
+# When set, the job is run under cProfile and tracemalloc and a report is
+# written to this path. Tools set this from the advanced "profile" toggle so
+# that the report is collected as an output of the job.
+PROFILE_ENV = 'Q2GALAXY_PROFILE'
+PROFILE_FILENAME = 'q2galaxy-profile.txt'
+PROFILE_TOP_N = 50
+
+# frames kept per allocation, enough to see past QIIME 2's view machinery
+_TRACEMALLOC_FRAMES = 10
+
+
+@contextlib.contextmanager
+def profile_job(plugin_id, action_id):
+    path = os.environ.get(PROFILE_ENV)
+    if not path:
+        yield
+        return
+
+    # only imported when profiling, as every job passes through here
+    import cProfile
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start(_TRACEMALLOC_FRAMES)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        with open(path, 'w') as fh:
+            fh.write(f'q2galaxy profile of {plugin_id} {action_id}\n\n')
+            fh.write(_format_stats(profiler))
+            fh.write('\n')
+            fh.write(_format_allocations(snapshot, peak))
+
+
+def _format_stats(profiler):
+    import pstats
+
+    buffer = io.StringIO()
+    buffer.write(f'== Top {PROFILE_TOP_N} functions by cumulative time ==\n')
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_N)
+
+    buffer.write(f'== Top {PROFILE_TOP_N} functions by internal time ==\n')
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(PROFILE_TOP_N)
+    return buffer.getvalue()
+
+
+def _format_allocations(snapshot, peak):
+    import cProfile
+    import tracemalloc
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+    lines = [f'== Top {PROFILE_TOP_N} live allocations at exit'
+             f' (peak traced: {peak / 1024 ** 2:.1f} MiB) ==']
+    top = snapshot.statistics('traceback')[:PROFILE_TOP_N]
+    for idx, stat in enumerate(top):
+        lines.append(f'#{idx + 1}: {stat.size / 1024:.1f} KiB in'
+                     f' {stat.count} block(s)')
+        lines.extend('  ' + line for line in
+                     stat.traceback.format(most_recent_first=True))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,144 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import json
+
+# Must agree with q2galaxy.core.templaters.action.INPUT_SCHEMA_VERSION, this
+# module is kept free of templating imports so that `run` stays light.
+SUPPORTED_SCHEMA_VERSIONS = {1}
+
+_SCALARS = (str, int, float, bool)
+
+
+def load_input_schema(path):
+    with open(path) as fh:
+        schema = json.load(fh)
+
+    version = schema.get('schema_version')
+    if version not in SUPPORTED_SCHEMA_VERSIONS:
+        raise ValueError(f"Unsupported input schema version: {version!r}")
+
+    return schema
+
+
+def validate_inputs(schema, inputs):
+    parameters = schema['parameters']
+    if type(inputs) is not dict:
+        raise ValueError("The tool inputs are not a JSON object.")
+
+    unknown = sorted(set(inputs) - set(parameters))
+    if unknown:
+        raise ValueError(f"Unrecognized parameter(s) {unknown}, expected some"
+                         f" of {sorted(parameters)}.")
+
+    for name, spec in parameters.items():
+        if name not in inputs:
+            if spec['required']:
+                raise ValueError(f"Missing required parameter {name!r}.")
+            continue
+
+        # Galaxy sends an unset optional input (one defaulting to None) as
+        # an empty value of its kind, rather than leaving it out
+        value = inputs[name]
+        if _is_unset(spec, value):
+            if spec['required']:
+                raise ValueError(f"{name!r} is required, but was not"
+                                 " provided.")
+            continue
+
+        _VALIDATORS[spec['kind']](name, spec, value)
+
+
+def _is_unset(spec, value):
+    if value is None:
+        return True
+    elif spec['kind'] == 'artifact' and spec['collection'] is None:
+        return (type(value) is dict and 'source_path' in value
+                and value['source_path'] is None)
+    elif spec['kind'] == 'metadata_column':
+        return type(value) is dict and value.get('type') == 'none'
+    elif spec['kind'] in ('artifact', 'metadata', 'primitive'):
+        return value == []
+    return False
+
+
+def _validate_artifact(name, spec, value):
+    if spec['collection'] is None:
+        _check_dataset(name, value)
+        return
+
+    if type(value) is not list:
+        raise ValueError(f"{name!r} expects a {spec['collection']} of"
+                         f" artifacts, but received {_kind(value)}.")
+    for idx, element in enumerate(value):
+        _check_dataset(f'{name}[{idx}]', element)
+
+
+def _validate_metadata(name, spec, value):
+    if type(value) is not list:
+        raise ValueError(f"{name!r} expects a list of metadata sources, but"
+                         f" received {_kind(value)}.")
+    for idx, entry in enumerate(value):
+        _check_metadata_entry(f'{name}[{idx}]', entry, ('tsv', 'qza'))
+
+
+def _validate_metadata_column(name, spec, value):
+    entry = _check_metadata_entry(name, value, ('tsv', 'qza'))
+    if 'column' not in entry:
+        raise ValueError(f"{name!r} does not specify a column.")
+
+
+def _validate_primitive(name, spec, value):
+    if spec['collection'] is None:
+        if type(value) not in _SCALARS:
+            raise ValueError(f"{name!r} expects {spec['type']}, but"
+                             f" received {_kind(value)}.")
+        return
+
+    if type(value) is not list:
+        raise ValueError(f"{name!r} expects a {spec['collection']}, but"
+                         f" received {_kind(value)}.")
+    for idx, element in enumerate(value):
+        if type(element) not in _SCALARS:
+            raise ValueError(f"{name}[{idx}] expects a primitive value, but"
+                             f" received {_kind(element)}.")
+
+
+def _validate_unsupported(name, spec, value):
+    raise ValueError(f"{name!r} ({spec['type']}) is not yet supported by"
+                     " q2galaxy.")
+
+
+_VALIDATORS = {
+    'artifact': _validate_artifact,
+    'metadata': _validate_metadata,
+    'metadata_column': _validate_metadata_column,
+    'primitive': _validate_primitive,
+    'unsupported': _validate_unsupported,
+}
+
+
+def _check_dataset(name, value):
+    if type(value) is not dict or 'source_path' not in value:
+        raise ValueError(f"{name!r} expects a dataset, but received"
+                         f" {_kind(value)}.")
+
+
+def _check_metadata_entry(name, entry, types):
+    if type(entry) is not dict or entry.get('type') not in types:
+        raise ValueError(f"{name!r} expects metadata of type {list(types)},"
+                         f" but received {_kind(entry)}.")
+    _check_dataset(name, entry.get('source'))
+    return entry
+
+
+def _kind(value):
+    if type(value) is dict:
+        return f'an object with keys {sorted(value)}'
+    elif type(value) is list:
+        return f'a list of {len(value)} element(s)'
+    return f'{type(value).__name__} {value!r}'
@@ -0,0 +1,64 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import collections
+
+from q2galaxy.core.drivers.settings import parse_size
+
+# All temporary I/O done by a job (stdio capture, staging imports, and
+# QIIME 2's own archive extraction) goes to one place. The job working
+# directory is often on shared NFS, which is a poor place to unzip to, so
+# these are tried in order, skipping any without enough free space.
+SCRATCH_CANDIDATES = ('_GALAXY_JOB_TMP_DIR', 'TMPDIR', 'Q2GALAXY_SCRATCH_DIR')
+SCRATCH_MIN_FREE_ENV = 'Q2GALAXY_SCRATCH_MIN_FREE'
+DEFAULT_MIN_FREE = 1024 ** 3
+
+Scratch = collections.namedtuple('Scratch', ['path', 'source', 'free'])
+
+_CURRENT_SCRATCH = None
+
+
+def configure_scratch():
+    global _CURRENT_SCRATCH
+    if _CURRENT_SCRATCH is None:
+        scratch = _find_scratch()
+        # QIIME 2 (and everything else) uses tempfile or $TMPDIR
+        tempfile.tempdir = scratch.path
+        os.environ['TMPDIR'] = scratch.path
+        _CURRENT_SCRATCH = scratch
+    return _CURRENT_SCRATCH
+
+
+def get_scratch_dir():
+    return configure_scratch().path
+
+
+def describe_scratch(scratch):
+    return (f'q2galaxy scratch directory: {scratch.path} (from'
+            f' {scratch.source}, {scratch.free / 1024 ** 3:.1f} GiB free)')
+
+
+def _find_scratch():
+    min_free = os.environ.get(SCRATCH_MIN_FREE_ENV)
+    min_free = parse_size(min_free) if min_free else DEFAULT_MIN_FREE
+
+    for source in SCRATCH_CANDIDATES:
+        path = os.environ.get(source)
+        if not path or not os.path.isdir(path):
+            continue
+        if not os.access(path, os.W_OK | os.X_OK):
+            continue
+
+        free = shutil.disk_usage(path).free
+        if free >= min_free:
+            return Scratch(os.path.abspath(path), source, free)
+
+    path = tempfile.gettempdir()
+    return Scratch(path, 'default', shutil.disk_usage(path).free)
@@ -0,0 +1,20 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+# Helpers for the environment variables which configure `q2galaxy run`.
+# (Not in q2galaxy.core.util, which is for templating and imports lxml.)
+
+
+_SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value):
+    # e.g. '500M', '2G', '1.5TB', or a plain number of bytes
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in _SIZE_UNITS:
+        return int(float(value[:-1]) * _SIZE_UNITS[value[-1]])
+    return int(value)
@@ -5,6 +5,7 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import os
 import sys
 import textwrap
 import tempfile
@@ -12,18 +13,39 @@ import contextlib
 
 import qiime2.util
 
+from q2galaxy.core.drivers.settings import parse_size
+from q2galaxy.core.drivers.scratch import configure_scratch, describe_scratch
+
 
 GALAXY_TRIMMED_STRING_LEN = 255
 # the width can be adjusted in the UI, but the default + kerning is about this
 MISC_INFO_WIDTH = 37
 
+# When set, logs larger than this are replayed as their head and tail (cut at
+# line breaks), with the full log written to a side file in STDIO_LOG_DIR_ENV,
+# or the job's working directory. Not the tmp dir, which may be the job's own
+# and so is deleted by Galaxy along with the side file.
+STDIO_LIMIT_ENV = 'Q2GALAXY_STDIO_LIMIT'
+STDIO_LOG_DIR_ENV = 'Q2GALAXY_STDIO_LOG_DIR'
+
+_COPY_BUFFER = 1024 * 1024
+# how far from the limit to look for a line break, before cutting a line
+_LINE_SEARCH = 64 * 1024
+
 
 @contextlib.contextmanager
 def stdio_files():
-    out = tempfile.NamedTemporaryFile(prefix='q2galaxy-stdout-', suffix='.log')
-    err = tempfile.NamedTemporaryFile(prefix='q2galaxy-stderr-', suffix='.log')
+    scratch = configure_scratch()
+    out = tempfile.NamedTemporaryFile(prefix='q2galaxy-stdout-', suffix='.log',
+                                      dir=scratch.path)
+    err = tempfile.NamedTemporaryFile(prefix='q2galaxy-stderr-', suffix='.log',
+                                      dir=scratch.path)
 
     with out as out, err as err:
+        # stderr, so that the start of stdout is still about the action
+        # flushed, as the redirect writes to the fd beneath this buffer
+        err.write((describe_scratch(scratch) + '\n').encode('utf8'))
+        err.flush()
         yield (out, err)
         # Everything has gone well so far, print the final contents
         _print_stdio((out, err))
@@ -62,10 +84,114 @@ def error_handler(header=''):
 
 def _print_stdio(stdio):
     out, err = stdio
-    out.seek(0)
-    err.seek(0)
-    for line in out:  # loop, just in case it's very big (like MAFFT)
-        print(line.decode('utf8'), file=sys.stdout, end='')
+    # Bytes are copied between file descriptors without being decoded, so
+    # this is fast for very chatty tools (like MAFFT) and tolerates output
+    # which isn't UTF-8.
+    _replay(out, sys.stdout, 'stdout')
+    _replay(err, sys.stderr, 'stderr')
+
+
+def _replay(log, stream, name):
+    # anything already printed (such as the error) must come out first
+    stream.flush()
+    log.flush()
+    size = os.fstat(log.fileno()).st_size
+
+    limit = os.environ.get(STDIO_LIMIT_ENV)
+    if not limit or size <= parse_size(limit):
+        _copy(log, stream, 0, size)
+        return
+
+    limit = parse_size(limit)
+    head_end = _head_end(log, limit // 2)
+    tail_start = _tail_start(log, size, size - (limit - limit // 2))
+    full_log = _save_full_log(log, name, size)
+
+    _copy(log, stream, 0, head_end)
+    marker = (f'[q2galaxy: {tail_start - head_end} bytes of {name} omitted,'
+              f' the full log was saved to {full_log}]\n')
+    if not _at_line_start(log, head_end):
+        # there was no line break to cut at, keep the marker on its own line
+        marker = '\n' + marker
+    _write(stream, marker.encode('utf8'))
+    _copy(log, stream, tail_start, size - tail_start)
+
+
+def _head_end(log, end):
+    # after the last line break before `end`
+    start = max(0, end - _LINE_SEARCH)
+    log.seek(start)
+    idx = log.read(end - start).rfind(b'\n')
+    return end if idx == -1 else start + idx + 1
+
+
+def _at_line_start(log, offset):
+    if offset == 0:
+        return True
+    log.seek(offset - 1)
+    return log.read(1) == b'\n'
+
+
+def _tail_start(log, size, start):
+    # after the first line break at or after `start` - 1, so that a line
+    # which begins exactly at `start` is kept whole
+    if start == 0:
+        return 0
+    log.seek(start - 1)
+    idx = log.read(min(size - start + 1, _LINE_SEARCH)).find(b'\n')
+    return start if idx == -1 else start + idx
+
+
+def _save_full_log(log, name, size):
+    log_dir = os.environ.get(STDIO_LOG_DIR_ENV) or os.getcwd()
+    fd, path = tempfile.mkstemp(prefix=f'q2galaxy-{name}-', suffix='.log',
+                                dir=log_dir)
+    with open(fd, 'wb') as fh:
+        _copy(log, fh, 0, size)
+    return path
+
+
+def _copy(src, dst, offset, count):
+    try:
+        dst_fd = dst.fileno()
+    except (AttributeError, OSError):
+        dst_fd = None
+
+    if dst_fd is not None:
+        try:
+            while count > 0:
+                sent = os.sendfile(dst_fd, src.fileno(), offset, count)
+                if sent == 0:
+                    return
+                offset += sent
+                count -= sent
+            return
+        except (AttributeError, OSError):
+            pass  # no sendfile for this platform or pair of files
+
+    # fall back to a plain copy of whatever remains, in large blocks
+    src.seek(offset)
+    while count > 0:
+        chunk = src.read(min(count, _COPY_BUFFER))
+        if not chunk:
+            return
+        _write(dst, chunk)
+        count -= len(chunk)
+
+
+def _write(stream, data):
+    stream.flush()
+    try:
+        fd = stream.fileno()
+    except (AttributeError, OSError):
+        fd = None
 
-    for line in err:
-        print(line.decode('utf8'), file=sys.stderr, end='')
+    if fd is not None:
+        data = memoryview(data)
+        while data:
+            data = data[os.write(fd, data):]
+    elif hasattr(stream, 'buffer'):
+        stream.buffer.write(data)
+        stream.flush()
+    else:
+        stream.write(data.decode('utf8', errors='replace'))
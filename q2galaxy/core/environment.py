@@ -7,7 +7,10 @@
 # ----------------------------------------------------------------------------
 import os
 import json
-import pkg_resources
+import functools
+import itertools
+import contextlib
+import importlib.metadata
 
 
 class CondaMeta:
@@ -16,15 +19,18 @@ class CondaMeta:
         self.meta = os.path.join(self.prefix, 'conda-meta')
         self.metapackage = metapackage
         self._cache = {}
+        self._primary_deps = {}
+        self._closures = {}
 
-        self.meta_lookup = {}
+    @functools.cached_property
+    def meta_lookup(self):
+        # Only the names are read here, the JSON itself is loaded on demand
+        lookup = {}
         for filename in os.listdir(self.meta):
             if filename.endswith('.json'):
                 name = filename.rsplit('-', 2)[0]
-                self.meta_lookup[name] = os.path.join(self.meta, filename)
-
-        self.backup = {d.project_name: d.version
-                       for d in pkg_resources.working_set}
+                lookup[name] = os.path.join(self.meta, filename)
+        return lookup
 
     def __getitem__(self, package):
         if package not in self._cache:
@@ -34,40 +40,100 @@ class CondaMeta:
         return self._cache[package]
 
     def iter_primary_deps(self, package):
-        if package not in self.meta_lookup:
-            return
-        yield from (dep.split(' ')[0] for dep in self[package]['depends']
-                    # Ignore conda "virtual packages"
-                    # https://conda.io/projects/conda/en/latest
-                    # /user-guide/tasks/manage-virtual.html
-                    if not dep.startswith('__'))
-
-    def iter_deps(self, *packages, include_self=True, _seen=None):
+        if package not in self._primary_deps:
+            if package not in self.meta_lookup:
+                deps = ()
+            else:
+                deps = tuple(dep.split(' ')[0]
+                             for dep in self[package]['depends']
+                             # Ignore conda "virtual packages"
+                             # https://conda.io/projects/conda/en/latest
+                             # /user-guide/tasks/manage-virtual.html
+                             if not dep.startswith('__'))
+            self._primary_deps[package] = deps
+        yield from self._primary_deps[package]
+
+    def iter_deps(self, *packages, include_self=True):
         if self.metapackage is not None:
             yield self.metapackage, self.get_version(self.metapackage)
             return
 
-        if _seen is None:
-            _seen = set()
-
-        if include_self:
-            for package in packages:
-                yield package, self.get_version(package)
-
-        for package in packages:
-            for dependency in self.iter_primary_deps(package):
-                if dependency in _seen:
-                    continue
-                else:
-                    _seen.add(dependency)
-                    yield from self.iter_deps(dependency, _seen=_seen)
+        # Every tool asks for the closure of its plugin's project (and the
+        # builtins for that of every project), so each is only walked once.
+        key = (packages, include_self)
+        if key not in self._closures:
+            self._closures[key] = tuple(
+                (package, self.get_version(package))
+                for package in self._walk_deps(packages, include_self))
+        yield from self._closures[key]
+
+    def _walk_deps(self, packages, include_self):
+        # A pre-order depth-first walk, with an explicit stack of iterators
+        # over each package's dependencies. The top-level packages are not
+        # marked as seen, so one can also appear as another's dependency.
+        order = list(packages) if include_self else []
+        seen = set()
+        stack = [itertools.chain.from_iterable(
+            self.iter_primary_deps(package) for package in packages)]
+        while stack:
+            for dependency in stack[-1]:
+                if dependency not in seen:
+                    seen.add(dependency)
+                    order.append(dependency)
+                    stack.append(self.iter_primary_deps(dependency))
+                    break
+            else:
+                stack.pop()
+        return order
 
     def get_version(self, package):
         if package not in self.meta_lookup:
-            return self.backup[package]
+            return _installed_version(package)
         return self[package]['version']
 
 
+class RecordedCondaMeta(CondaMeta):
+    # An environment as `q2galaxy snapshot` recorded it: `packages` holds the
+    # conda-meta version and depends of each conda package, `installed` the
+    # version of everything else the requirements named (e.g. pip installs).
+    def __init__(self, packages, installed, metapackage=None):
+        super().__init__(None, metapackage=metapackage)
+        self.packages = packages
+        self.installed = installed
+
+    @functools.cached_property
+    def meta_lookup(self):
+        return dict.fromkeys(self.packages)
+
+    def __getitem__(self, package):
+        return self.packages[package]
+
+    def get_version(self, package):
+        if package not in self.packages:
+            return self.installed[package]
+        return self.packages[package]['version']
+
+
+def record_conda_meta(conda_meta, project_names):
+    # What a RecordedCondaMeta needs to resolve the requirements of these
+    # projects (and of any metapackage in the environment)
+    packages = {name: {'version': conda_meta[name]['version'],
+                       'depends': conda_meta[name]['depends']}
+                for name in sorted(conda_meta.meta_lookup)}
+    installed = {name: conda_meta.get_version(name)
+                 for name in sorted(project_names) if name not in packages}
+    return {'packages': packages, 'installed': installed}
+
+
+# For packages which were not installed by conda (e.g. `pip install -e`)
+@functools.lru_cache(maxsize=None)
+def _installed_version(package):
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        raise KeyError(package)
+
+
 def get_conda_prefix():
     conda_prefix = os.getenv('CONDA_PREFIX')
     if conda_prefix is None:
@@ -85,3 +151,15 @@ def find_conda_meta(metapackage=None):
         prefix = get_conda_prefix()
         _CURRENT_META = CondaMeta(prefix, metapackage=metapackage)
     return _CURRENT_META
+
+
+@contextlib.contextmanager
+def conda_environment(conda_meta):
+    # e.g. a snapshot's RecordedCondaMeta, in place of the active environment
+    global _CURRENT_META
+    previous = _CURRENT_META
+    _CURRENT_META = conda_meta
+    try:
+        yield conda_meta
+    finally:
+        _CURRENT_META = previous
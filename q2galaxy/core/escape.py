@@ -0,0 +1,94 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import functools
+
+# Kept apart from q2galaxy.core.util so that `q2galaxy run` can unescape its
+# inputs without importing lxml and the rest of the templating machinery.
+
+
+# see: https://github.com/galaxyproject/galaxy/blob
+#      /2f3096790d4a77ba75b651f4abc43c740687c1e1/lib/galaxy/util
+#      /__init__.py#L527-L539
+# AKA: galaxy.util:mapped_chars
+_escaped = [
+    # only `[]` is likely to come up, but better safe than sorry
+    ('[', '__ob__'),
+    (']', '__cb__'),
+    ('>', '__gt__'),
+    ('<', '__lt__'),
+    ('\'', '__sq__'),
+    ('"', '__dq__'),
+    ('{', '__oc__'),
+    ('}', '__cc__'),
+    ('@', '__at__'),
+    ('\n', '__cn__'),
+    ('\r', '__cr__'),
+    ('\t', '__tc__'),
+    ('#', '__pd__'),
+    # adding this one so that <test/> won't see multiple values
+    (',', '__comma__')
+]
+_mapped = [
+    # Custom:
+    (None, '__q2galaxy__::literal::None'),
+    (True, '__q2galaxy__::literal::True'),
+    (False, '__q2galaxy__::literal::False')
+]
+
+
+_mapped_esc = {val: esc for val, esc in _mapped}
+_mapped_unesc = {esc: val for val, esc in _mapped}
+
+
+@functools.lru_cache(maxsize=None)
+def _esc_str(s):
+    # The same type and format names are escaped over and over again while
+    # templating, so this is cached. (A chain of str.replace is still faster
+    # than a regex or translation table for strings of this size.)
+    for char, esc in _escaped:
+        s = s.replace(char, esc)
+    return s
+
+
+def galaxy_esc(s):
+    if type(s) is str:
+        return _esc_str(s)
+    # identity checks, as 1 == True and 0 == False would hash alike
+    elif s is None or s is True or s is False:
+        return _mapped_esc[s]
+    raise NotImplementedError
+
+
+def galaxy_unesc(s):
+    try:
+        return _mapped_unesc[s]
+    except KeyError:
+        pass
+
+    # Every escape starts with a double underscore, most strings (such as
+    # dataset paths) won't have one at all.
+    if '__' not in s:
+        return s
+
+    for char, esc in _escaped:
+        s = s.replace(esc, char)
+    return s
+
+
+def galaxy_ui_var(*, value=None, tag=None, name=None):
+    if value is not None:
+        return f'__q2galaxy__::control::{value}'
+
+    elements = ['', 'q2galaxy', 'GUI']
+    if tag is not None:
+        elements.append(tag)
+    if name is not None:
+        elements.append(name)
+
+    elements.append('')
+    return '__'.join(elements)
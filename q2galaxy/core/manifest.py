@@ -0,0 +1,154 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import json
+import hashlib
+
+from q2galaxy.core.util import write_if_changed
+
+# `template all` leaves a manifest of what it wrote in the output directory:
+# the tools (by plugin and action), every file, and the options used. Paths
+# are relative to the output directory, so a directory (e.g. one shard of a
+# sharded run) can be moved before it is merged. Nothing about a particular
+# run (statuses, timings) is kept, so templating the same tools again leaves
+# the manifest as it was.
+MANIFEST_FILENAME = 'q2galaxy-manifest.json'
+MANIFEST_FORMAT = 'q2galaxy-manifest'
+MANIFEST_VERSION = 1
+
+
+def parse_shard(text):
+    # "i/N", e.g. 0/4 is the first of four shards
+    try:
+        index, count = (int(x) for x in text.split('/'))
+    except ValueError:
+        raise ValueError(f"{text!r} is not a shard, expected e.g. '0/4'.")
+    if not 0 <= index < count:
+        raise ValueError(f"{text!r} is not a shard, expected i/N with"
+                         " 0 <= i < N.")
+    return index, count
+
+
+def in_shard(key, shard):
+    # sha1 rather than hash(), which is salted per process
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index
+
+
+def make_manifest(directory, statuses, shard=None, **options):
+    tools = []
+    builtins = []
+    files = []
+    for status in statuses:
+        if status['type'] != 'file':
+            continue
+        path = _relpath(status['path'], directory)
+        files.append(path)
+        if path.endswith('.xml') and status.get('action') is not None:
+            tools.append({'plugin': status['plugin'],
+                          'action': status['action'],
+                          'path': path})
+            if status['plugin'] == 'tools':
+                builtins.append(path)
+
+    # `builtins` keeps the order the builtins were made in (for tool_conf),
+    # which depends on the plugins and on what is importable here
+    return {'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION,
+            'shard': None if shard is None else list(shard),
+            'options': options,
+            'tools': sorted(tools, key=lambda x: x['path']),
+            'builtins': builtins,
+            'files': sorted(set(files))}
+
+
+def merge_manifests(manifests):
+    # every shard of one run, in any order
+    if any(m['shard'] is None for m in manifests):
+        raise ValueError("Only the shards of a sharded run can be merged.")
+    manifests = sorted(manifests, key=lambda x: x['shard'][0])
+    counts = {m['shard'][1] for m in manifests}
+    indices = [m['shard'][0] for m in manifests]
+    if len(counts) != 1 or indices != list(range(counts.pop())):
+        found = ', '.join(f"{i}/{n}" for i, n in
+                          (m['shard'] for m in manifests))
+        raise ValueError("Expected every shard of one sharded run, found:"
+                         f" {found}.")
+    options = [m['options'] for m in manifests]
+    if any(o != options[0] for o in options):
+        raise ValueError("The shards were templated with different options.")
+
+    tools = {t['path']: t for m in manifests for t in m['tools']}
+    builtins = {path: None for m in manifests for path in m['builtins']}
+    return {'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION,
+            'shard': None,
+            'options': options[0],
+            'tools': [tools[path] for path in sorted(tools)],
+            'builtins': list(builtins),
+            'files': sorted({f for m in manifests for f in m['files']})}
+
+
+def write_manifest(manifest, directory):
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    blob = (json.dumps(manifest, indent=2, sort_keys=True) + '\n').encode(
+        'utf-8')
+    nbytes, changed = write_if_changed(path, lambda fh: fh.write(blob))
+    return path, nbytes, changed
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        raise ValueError(f"{directory} has no {MANIFEST_FILENAME}, was it"
+                         " made by `q2galaxy template all`?")
+    with open(path) as fh:
+        manifest = json.load(fh)
+
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise ValueError(f"{path} is not a q2galaxy manifest.")
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"{path} is a version {manifest.get('version')}"
+                         f" manifest, this q2galaxy reads version"
+                         f" {MANIFEST_VERSION}.")
+    return manifest
+
+
+def stale_paths(manifest, directory):
+    # What earlier templating left in the suite directories (suite_qiime2__*
+    # and the builtins' suite_qiime2_<distro>__tools) which the manifest
+    # doesn't list: the suites of removed plugins, and the tools, schemas,
+    # and test data of removed actions. A current suite keeps its test-data.
+    files = set(manifest['files'])
+    parents = set()
+    for relpath in files:
+        parts = relpath.split('/')
+        parents.update('/'.join(parts[:i]) for i in range(1, len(parts)))
+    parents.update([f'{relpath}/test-data' for relpath in parents
+                    if '/' not in relpath])
+
+    stale = []
+    stack = [name for name in os.listdir(directory)
+             if name.startswith('suite_qiime2')
+             and os.path.isdir(os.path.join(directory, name))]
+    while stack:
+        relpath = stack.pop()
+        if relpath in files:
+            continue
+        if relpath not in parents:
+            stale.append(relpath)
+            continue
+        path = os.path.join(directory, *relpath.split('/'))
+        if os.path.isdir(path):
+            stack.extend(f'{relpath}/{name}' for name in os.listdir(path))
+    return sorted(stale)
+
+
+def _relpath(path, directory):
+    return os.path.relpath(path, directory).replace(os.sep, '/')
@@ -0,0 +1,37 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import zipfile
+import collections
+
+
+ArchivePeek = collections.namedtuple('ArchivePeek',
+                                     ['uuid', 'type', 'format'])
+
+
+def peek(path):
+    # yaml is only needed once there is an archive to peek at, which keeps it
+    # out of `q2galaxy --help` and the like
+    import yaml
+
+    # Only the zip central directory and metadata.yaml are read, so this is
+    # cheap regardless of how large the archive's payload is.
+    try:
+        with zipfile.ZipFile(path) as zf:
+            names = zf.namelist()
+            root = names[0].split('/', 1)[0]
+            with zf.open(f'{root}/metadata.yaml') as fh:
+                metadata = yaml.safe_load(fh)
+    except (zipfile.BadZipFile, IndexError, KeyError, yaml.YAMLError):
+        raise ValueError(f'{path!r} is not a QIIME 2 archive.')
+
+    try:
+        return ArchivePeek(uuid=str(metadata['uuid']),
+                           type=str(metadata['type']),
+                           format=metadata.get('format'))
+    except (TypeError, KeyError):
+        raise ValueError(f'{path!r} does not have valid QIIME 2 metadata.')
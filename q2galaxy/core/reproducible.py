@@ -0,0 +1,200 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import re
+import time
+import uuid
+import hashlib
+import zipfile
+import tempfile
+import contextlib
+import collections
+from datetime import datetime, timezone
+
+import qiime2
+
+# Within a reproducible session, templating the same environment twice
+# writes the same bytes: the copyright year comes from SOURCE_DATE_EPOCH
+# (https://reproducible-builds.org/specs/source-date-epoch/), and the test
+# data archives are rewritten with stable UUIDs, runtimes, and zip timestamps.
+# Without SOURCE_DATE_EPOCH, the start of the QIIME 2 release's month is used.
+# Only the framework's parts of an archive are rewritten, formats which embed
+# their own timestamps (e.g. BIOM) are left as they are.
+SOURCE_DATE_EPOCH_ENV = 'SOURCE_DATE_EPOCH'
+
+ReproducibleSession = collections.namedtuple(
+    'ReproducibleSession', ['epoch', 'uuids'])
+
+_CURRENT_SESSION = None
+
+# zip can't represent anything earlier
+_ZIP_EPOCH = 315532800  # 1980-01-01
+_UUID4 = re.compile(rb'[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}'
+                    rb'-[0-9a-f]{12}')
+_RUNTIME = re.compile(rb'^(?P<indent>[ ]*)runtime:\n'
+                      rb'(?P<body>(?:(?P=indent)[ ]+\S.*\n)*)', re.M)
+_RUNTIME_FIELD = re.compile(rb'^(?P<key>[ ]+(?:start|end|duration): ).*$',
+                            re.M)
+_CHECKSUMS = 'checksums.md5'
+
+
+@contextlib.contextmanager
+def reproducible(enabled=True):
+    global _CURRENT_SESSION
+    previous = _CURRENT_SESSION
+    if enabled:
+        _CURRENT_SESSION = ReproducibleSession(source_date_epoch(), {})
+    try:
+        yield _CURRENT_SESSION
+    finally:
+        _CURRENT_SESSION = previous
+
+
+def get_reproducible():
+    return _CURRENT_SESSION
+
+
+def source_date_epoch():
+    value = os.environ.get(SOURCE_DATE_EPOCH_ENV)
+    if value is None:
+        return _release_epoch()
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{SOURCE_DATE_EPOCH_ENV} must be an integer number"
+                         f" of seconds, not {value!r}.")
+
+
+def build_year():
+    # SOURCE_DATE_EPOCH is honored whenever it is set, as the spec asks
+    if _CURRENT_SESSION is not None:
+        epoch = _CURRENT_SESSION.epoch
+    elif os.environ.get(SOURCE_DATE_EPOCH_ENV) is not None:
+        epoch = source_date_epoch()
+    else:
+        return datetime.now().year
+    return datetime.fromtimestamp(epoch, timezone.utc).year
+
+
+def _release_epoch():
+    # QIIME 2 is versioned by year and month (e.g. 2023.5.0)
+    match = re.match(r'(\d{4})\.(\d{1,2})\b', qiime2.__version__)
+    if match is None:
+        return _ZIP_EPOCH
+    year, month = (int(x) for x in match.groups())
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def normalize_test_data(path, key):
+    # `key` names the data (e.g. its filename), the UUIDs are derived from it
+    if _CURRENT_SESSION is None:
+        return
+    if os.path.isdir(path):
+        # a collection
+        for name in sorted(os.listdir(path)):
+            normalize_test_data(os.path.join(path, name), f'{key}/{name}')
+    elif path.endswith(('.qza', '.qzv')) and zipfile.is_zipfile(path):
+        _normalize_archive(path, key, _CURRENT_SESSION)
+
+
+def _normalize_archive(path, key, session):
+    with zipfile.ZipFile(path) as zf:
+        entries = [(info, zf.read(info)) for info in zf.infolist()]
+
+    uuids = _map_uuids(entries, key, session.uuids)
+
+    def sub(blob):
+        return _UUID4.sub(lambda m: uuids[m.group()], blob)
+
+    runtime = datetime.fromtimestamp(session.epoch, timezone.utc).isoformat()
+    contents = {}
+    infos = {}
+    for info, data in entries:
+        name = sub(info.filename.encode('utf-8')).decode('utf-8')
+        if _is_text(info.filename):
+            data = _RUNTIME.sub(
+                lambda m: _normalize_runtime(m, runtime.encode('ascii')),
+                sub(data))
+        contents[name] = data
+        infos[name] = info
+
+    for name in contents:
+        if name.count('/') == 1 and name.endswith('/' + _CHECKSUMS):
+            contents[name] = _rewrite_checksums(contents, name, sub)
+
+    date_time = time.gmtime(max(session.epoch, _ZIP_EPOCH))[:6]
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    suffix='.tmp')
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', allowZip64=True) as zf:
+            for name in sorted(contents):
+                old = infos[name]
+                info = zipfile.ZipInfo(name, date_time=date_time)
+                info.compress_type = old.compress_type
+                info.external_attr = old.external_attr
+                info.create_system = old.create_system
+                zf.writestr(info, contents[name])
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _is_text(filename):
+    return filename.endswith('.yaml')
+
+
+def _map_uuids(entries, key, known):
+    # A UUID is numbered by the first entry it appears in, visiting entries
+    # by their name and (text) content with every UUID masked, which doesn't
+    # depend on the UUIDs qiime2 happened to pick. UUIDs seen earlier in the
+    # session (e.g. an input's, in its output's provenance) are kept.
+    def masked(info, data):
+        name = _UUID4.sub(b'-', info.filename.encode('utf-8'))
+        return name, _UUID4.sub(b'-', data) if _is_text(info.filename) else b''
+
+    uuids = {}
+    for info, data in sorted(entries, key=lambda x: masked(*x)):
+        blob = info.filename.encode('utf-8')
+        if _is_text(info.filename):
+            blob += b'\n' + data
+        for match in _UUID4.finditer(blob):
+            old = match.group()
+            if old in uuids:
+                continue
+            if old not in known:
+                seed = f'{key}:{len(uuids)}'.encode('utf-8')
+                known[old] = str(uuid.UUID(
+                    bytes=hashlib.sha256(seed).digest()[:16],
+                    version=4)).encode('ascii')
+            uuids[old] = known[old]
+    return uuids
+
+
+def _normalize_runtime(match, timestamp):
+    def field(m):
+        if m.group('key').strip() == b'duration:':
+            return m.group('key') + b'0 microseconds'
+        return m.group('key') + timestamp
+
+    return (match.group('indent') + b'runtime:\n'
+            + _RUNTIME_FIELD.sub(field, match.group('body')))
+
+
+def _rewrite_checksums(contents, name, sub):
+    # the listed paths now have new UUIDs and contents
+    root = name.split('/')[0]
+    lines = []
+    for line in sub(contents[name]).decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        _, relpath = line.split('  ', 1)
+        digest = hashlib.md5(contents[f'{root}/{relpath}']).hexdigest()
+        lines.append((relpath, f'{digest}  {relpath}\n'))
+    return ''.join(line for _, line in sorted(lines)).encode('utf-8')
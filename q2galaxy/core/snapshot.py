@@ -0,0 +1,234 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import gzip
+import json
+import types
+import base64
+import collections
+
+import lxml.etree as xml
+from qiime2.core.cite import CitationRecord
+
+from q2galaxy.core.util import write_if_changed
+from q2galaxy.core.templaters.action import ToolBody
+from q2galaxy.core.templaters.registry import (
+    RegistryIndex, PluginRecord, TypeRecord, FormatRecord, FieldRecord)
+
+# A snapshot holds what the templaters read from the plugins, taken in the
+# full environment (`q2galaxy snapshot`), so that `template ... --snapshot`
+# can run elsewhere without importing any plugins:
+#   plugins: each plugin's and action's ids, names, versions, and citations,
+#       with the parts of each tool its signature and examples decide (see
+#       ToolBody), its input schema, and its example data (as base64)
+#   registry: the semantic types and their formats (see RegistryIndex)
+#   environment: the conda packages the requirements are resolved against
+# The rest (requirements, citations, macros, containers, the builtins...) is
+# made when templating, so every option of `template` still applies. A path
+# ending in .gz is compressed.
+SNAPSHOT_FORMAT = 'q2galaxy-snapshot'
+SNAPSHOT_VERSION = 2
+
+Snapshot = collections.namedtuple(
+    'Snapshot', ['plugins', 'registry', 'environment', 'versions'])
+SnapshotPlugin = collections.namedtuple(
+    'SnapshotPlugin', ['id', 'name', 'version', 'project_name', 'citations',
+                       'actions'])
+# body is still encoded (see decode_body), test_data is {relpath: base64}
+SnapshotAction = collections.namedtuple(
+    'SnapshotAction', ['id', 'name', 'citations', 'body', 'schema',
+                       'test_data'])
+
+
+def make_snapshot(plugins, registry, environment, **versions):
+    return {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION,
+            **versions,
+            'plugins': plugins,
+            'registry': registry,
+            'environment': environment}
+
+
+def encode_plugin(plugin, actions):
+    return {'id': plugin.id, 'name': plugin.name, 'version': plugin.version,
+            'project_name': plugin.project_name,
+            'citations': _encode_citations(plugin.citations),
+            'actions': actions}
+
+
+def encode_action(action, body, schema, test_data):
+    return {'id': action.id, 'name': action.name,
+            'citations': _encode_citations(action.citations),
+            'body': {field: _encode_tree(getattr(body, field))
+                     for field in ToolBody._fields},
+            'schema': schema,
+            'test_data': test_data}
+
+
+def decode_body(body):
+    return ToolBody(**{field: _decode_tree(body[field])
+                       for field in ToolBody._fields})
+
+
+def _encode_citations(citations):
+    # fields as pairs, as the snapshot's keys are sorted
+    return [{'type': record.type, 'fields': list(record.fields.items())}
+            for record in citations]
+
+
+def _decode_citations(citations):
+    return tuple(CitationRecord(record['type'], dict(record['fields']))
+                 for record in citations)
+
+
+def _encode_tree(element):
+    return xml.tostring(element, encoding='unicode')
+
+
+def _decode_tree(text):
+    return xml.fromstring(text)
+
+
+def encode_index(index):
+    formats = {}
+    plugins = {}
+
+    def encode_format(record):
+        if record.name not in formats:
+            formats[record.name] = {
+                'doc': record.doc, 'kind': record.kind,
+                'fields': [{'name': field.name, 'pathspec': field.pathspec,
+                            'format': encode_format(field.format),
+                            'collection': field.collection}
+                           for field in record.fields]}
+        return record.name
+
+    def encode_formats(pairs):
+        for _, plugin in pairs:
+            encode_plugin_record(plugin)
+        return [[encode_format(fmt), plugin.id] for fmt, plugin in pairs]
+
+    def encode_plugin_record(plugin):
+        plugins[plugin.id] = {'version': plugin.version,
+                              'project_name': plugin.project_name}
+        return plugin.id
+
+    types_ = []
+    for record in index.records:
+        key = record.semantic_type
+        default_format = index.default_formats.get(key)
+        types_.append({
+            'type': key, 'family': record.family,
+            'plugin': encode_plugin_record(record.plugin),
+            'importable': encode_formats(index.importable[key]),
+            'exportable': encode_formats(index.exportable[key]),
+            'default_format': None if default_format is None
+            else encode_format(default_format)})
+
+    return {'types': types_, 'formats': formats, 'plugins': plugins,
+            'import_fastq': index.import_fastq}
+
+
+def _decode_index(registry):
+    plugins = {id_: PluginRecord(id_, plugin['version'],
+                                 plugin['project_name'])
+               for id_, plugin in registry['plugins'].items()}
+    formats = {}
+
+    def decode_format(name):
+        if name not in formats:
+            fmt = registry['formats'][name]
+            formats[name] = FormatRecord(
+                name, fmt['doc'], fmt['kind'],
+                tuple(FieldRecord(field['name'], field['pathspec'],
+                                  decode_format(field['format']),
+                                  field['collection'])
+                      for field in fmt['fields']))
+        return formats[name]
+
+    records = []
+    families = collections.defaultdict(list)
+    importable = {}
+    exportable = {}
+    default_formats = {}
+    for type_ in registry['types']:
+        key = type_['type']
+        record = TypeRecord(key, type_['family'], plugins[type_['plugin']])
+        records.append(record)
+        families[record.family].append(record)
+        importable[key] = tuple((decode_format(fmt), plugins[plugin])
+                                for fmt, plugin in type_['importable'])
+        exportable[key] = tuple((decode_format(fmt), plugins[plugin])
+                                for fmt, plugin in type_['exportable'])
+        if type_['default_format'] is not None:
+            default_formats[key] = decode_format(type_['default_format'])
+
+    return RegistryIndex(
+        records=tuple(records),
+        families=types.MappingProxyType(
+            {name: tuple(families[name]) for name in sorted(families)}),
+        importable=types.MappingProxyType(importable),
+        exportable=types.MappingProxyType(exportable),
+        default_formats=types.MappingProxyType(default_formats),
+        import_fastq=registry['import_fastq'])
+
+
+def _decode_plugin(plugin):
+    actions = {action['id']: SnapshotAction(
+                   action['id'], action['name'],
+                   _decode_citations(action['citations']), action['body'],
+                   action['schema'], action['test_data'])
+               for action in plugin['actions']}
+    return SnapshotPlugin(plugin['id'], plugin['name'], plugin['version'],
+                          plugin['project_name'],
+                          _decode_citations(plugin['citations']), actions)
+
+
+def encode_dir(directory):
+    files = {}
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, directory).replace(os.sep, '/')
+            with open(path, 'rb') as fh:
+                files[relpath] = base64.b64encode(fh.read()).decode('ascii')
+    return dict(sorted(files.items()))
+
+
+def decode_file(blob):
+    return base64.b64decode(blob)
+
+
+def write_snapshot(snapshot, path):
+    blob = json.dumps(snapshot, sort_keys=True).encode('utf-8') + b'\n'
+    if path.endswith('.gz'):
+        # mtime=0, so the same snapshot is the same file
+        blob = gzip.compress(blob, mtime=0)
+    return write_if_changed(path, lambda fh: fh.write(blob))
+
+
+def load_snapshot(path):
+    with open(path, 'rb') as fh:
+        blob = fh.read()
+    if path.endswith('.gz'):
+        blob = gzip.decompress(blob)
+    snapshot = json.loads(blob)
+
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a q2galaxy snapshot.")
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is a version {snapshot.get('version')}"
+                         f" snapshot, this q2galaxy reads version"
+                         f" {SNAPSHOT_VERSION}.")
+
+    plugins = {plugin['id']: _decode_plugin(plugin)
+               for plugin in snapshot['plugins']}
+    return Snapshot(plugins=plugins,
+                    registry=_decode_index(snapshot['registry']),
+                    environment=snapshot['environment'],
+                    versions={'q2galaxy': snapshot['q2galaxy'],
+                              'qiime2': snapshot['qiime2']})
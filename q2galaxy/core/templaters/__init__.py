@@ -6,27 +6,67 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 import types
+import functools
 
-from q2galaxy.core.templaters.action import make_tool
-from q2galaxy.core.templaters.common import make_tool_id
+from q2galaxy.core.templaters.action import (
+    make_tool, make_tool_body, assemble_tool, ToolBody, make_input_schema,
+    make_schema_filename)
+from q2galaxy.core.templaters.common import make_tool_id, project_names
+from q2galaxy.core.templaters.macros import (
+    SuiteMacros, suite_macros, get_suite_macros, make_macros_import,
+    MACROS_FILENAME)
+from q2galaxy.core.templaters.containers import (
+    ContainerImage, parse_container, container_images, get_container_images,
+    make_containers_manifest, CONTAINERS_FILENAME)
+from q2galaxy.core.templaters.registry import (
+    registry_index, get_registry_index, RegistryIndex)
 from q2galaxy.core.templaters.import_data import make_builtin_import
 from q2galaxy.core.templaters.import_fastq_data import \
     make_builtin_import_fastq
 from q2galaxy.core.templaters.export_data import make_builtin_export
 # from q2galaxy.core.templaters.qza_to_tabular import make_builtin_to_tabular
 
-from q2galaxy.core.drivers.builtins import IMPORT_FASTQ
+# import_fastq is only made when the registry's q2-types can import fastq
+# (see RegistryIndex.import_fastq)
+IMPORT_FASTQ = make_tool_id('tools', 'import_fastq')
 
 BUILTINS = {
     make_tool_id('tools', 'import'): make_builtin_import,
     make_tool_id('tools', 'export'): make_builtin_export,
     # make_tool_id('tools', 'qza_to_tabular'): make_builtin_to_tabular,
+    IMPORT_FASTQ: make_builtin_import_fastq,
 }
 
-if IMPORT_FASTQ:
-    BUILTINS[make_tool_id('tools', 'import_fastq')] = make_builtin_import_fastq
-
 BUILTIN_MAKERS = types.MappingProxyType(BUILTINS)
 
+# These builtins have a <when> for every semantic type in the registry, which
+# Galaxy expands each time the form is built. They can instead be split into
+# one tool per type family (e.g. qiime2__tools__import_FeatureTable).
+SPLITTABLE_BUILTINS = frozenset([make_tool_id('tools', 'import'),
+                                 make_tool_id('tools', 'export')])
+
+
+def iter_builtin_makers(split=False):
+    index = get_registry_index()
+    for tool_id, tool_maker in BUILTIN_MAKERS.items():
+        if tool_id == IMPORT_FASTQ and not index.import_fastq:
+            continue
+        if not split or tool_id not in SPLITTABLE_BUILTINS:
+            yield tool_id, tool_maker
+            continue
+
+        for family in index.families:
+            yield (f'{tool_id}_{family}',
+                   functools.partial(tool_maker, family=family))
+
 
-__all__ = ['make_tool', 'make_tool_id', 'BUILTIN_MAKERS']
+__all__ = ['make_tool', 'make_tool_body', 'assemble_tool', 'ToolBody',
+           'make_tool_id', 'make_input_schema', 'make_schema_filename',
+           'BUILTIN_MAKERS', 'SPLITTABLE_BUILTINS', 'IMPORT_FASTQ',
+           'iter_builtin_makers', 'registry_index', 'get_registry_index',
+           'RegistryIndex',
+           'SuiteMacros', 'suite_macros', 'get_suite_macros',
+           'make_macros_import', 'MACROS_FILENAME', 'project_names',
+           'ContainerImage', 'parse_container', 'container_images',
+           'get_container_images', 'make_containers_manifest',
+           'CONTAINERS_FILENAME']
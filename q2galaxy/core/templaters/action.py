@@ -5,6 +5,8 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import collections
+
 import qiime2.sdk as sdk
 from qiime2.core.type.util import is_collection_type
 
@@ -12,19 +14,34 @@ import q2galaxy
 from q2galaxy.api.usage import GalaxyRSTInstructionsUsage
 from q2galaxy.core.usage import GalaxyTestUsage
 from q2galaxy.core.util import XMLNode, galaxy_ui_var, rst_header
+from q2galaxy.core.trace import span
 from q2galaxy.core.templaters.common import (
     make_tool_id, make_tool_name, make_config, make_citations,
     make_requirements, make_xrefs)
 from q2galaxy.core.templaters.helpers import signature_to_galaxy
+from q2galaxy.core.drivers.profile import PROFILE_ENV, PROFILE_FILENAME
+
+
+# What a tool's inputs, outputs, tests, and help are rendered from (the
+# action's signature and examples) is all that needs the plugin itself, so
+# these are what a snapshot keeps (see q2galaxy.core.snapshot).
+ToolBody = collections.namedtuple('ToolBody',
+                                  ['inputs', 'outputs', 'tests', 'help'])
 
 
 def make_tool(conda_meta, plugin, action, test_dir):
+    body = make_tool_body(plugin, action, test_dir)
+    return assemble_tool(conda_meta, plugin, action, body)
+
+
+def make_tool_body(plugin, action, test_dir):
     signature = action.signature
 
     inputs = XMLNode('inputs')
     advanced = []
     for case in signature_to_galaxy(signature):
-        xml = case.inputs_xml()
+        with span(case.name, cat='templaters', case=type(case).__name__):
+            xml = case.inputs_xml()
         if case.is_advanced():
             if type(xml) is list:
                 advanced.extend(xml)
@@ -36,12 +53,12 @@ def make_tool(conda_meta, plugin, action, test_dir):
             else:
                 inputs.append(xml)
 
-    if advanced:
-        section = XMLNode('section', name=galaxy_ui_var(tag='section',
-                                                        name='extra_opts'),
-                          title='Click here for additional options')
-        section.extend(advanced)
-        inputs.append(section)
+    # Always present, as it holds the profiling toggle
+    section = XMLNode('section', name=EXTRA_OPTS,
+                      title='Click here for additional options')
+    section.extend(advanced)
+    section.append(make_profile_param())
+    inputs.append(section)
 
     outputs = XMLNode('outputs')
     for name, spec in signature.outputs.items():
@@ -50,6 +67,18 @@ def make_tool(conda_meta, plugin, action, test_dir):
         else:
             output = make_output(name, spec)
         outputs.append(output)
+    outputs.append(make_profile_output())
+
+    with span('make_tests', cat='templaters'):
+        tests = make_tests(action, test_dir)
+    with span('make_help', cat='templaters'):
+        help_ = make_help(plugin, action, test_dir)
+    return ToolBody(inputs, outputs, tests, help_)
+
+
+def assemble_tool(conda_meta, plugin, action, body):
+    # Only the ids, names, versions, project name, and citations of `plugin`
+    # and `action` are used, which a snapshot's records also have.
 
     # Drop local identifier if it exists, it will be in a different local
     # identifier (multiple + is not allowed in pep440)
@@ -70,16 +99,60 @@ def make_tool(conda_meta, plugin, action, test_dir):
     tool.append(make_command(plugin, action))
     tool.append(make_version_command(plugin))
     tool.append(make_config(action=True))
-    tool.append(inputs)
-    tool.append(outputs)
-    tool.append(make_tests(action, test_dir))
-    tool.append(make_help(plugin, action, test_dir))
+    tool.append(body.inputs)
+    tool.append(body.outputs)
+    tool.append(body.tests)
+    tool.append(body.help)
     tool.append(make_citations(plugin, action))
-    tool.append(make_requirements(conda_meta, plugin.project_name))
+    with span('make_requirements', cat='templaters'):
+        tool.append(make_requirements(conda_meta, plugin.project_name))
     tool.append(make_xrefs())
     return tool
 
 
+# Bump when the layout below changes so `q2galaxy run` can tell
+INPUT_SCHEMA_VERSION = 1
+
+
+def make_input_schema(plugin, action):
+    parameters = {}
+    for case in signature_to_galaxy(action.signature):
+        parameters[case.name] = case.input_schema()
+
+    return {'schema_version': INPUT_SCHEMA_VERSION,
+            'tool_id': make_tool_id(plugin.id, action.id),
+            'plugin': plugin.id,
+            'action': action.id,
+            'parameters': parameters}
+
+
+def make_schema_filename(plugin, action):
+    return make_tool_id(plugin.id, action.id) + '.schema.json'
+
+
+# The toggle is named as a GUI variable so `q2galaxy run` never sees it, its
+# only effect is on the command's environment and the extra output.
+EXTRA_OPTS = galaxy_ui_var(tag='section', name='extra_opts')
+PROFILE_TOGGLE = galaxy_ui_var(tag='profile')
+
+
+def make_profile_param():
+    return XMLNode('param', name=PROFILE_TOGGLE, type='boolean',
+                   label='Profile this job:',
+                   help='Record where time and memory were spent and add the'
+                        ' report to your history. This makes the job slower'
+                        ' and is only useful for reporting performance'
+                        ' problems.')
+
+
+def make_profile_output():
+    output = XMLNode('data', format='txt', name='q2galaxy_profile',
+                     from_work_dir=PROFILE_FILENAME,
+                     label='${tool.id} on ${on_string}: profile')
+    output.append(XMLNode('filter', f"{EXTRA_OPTS}['{PROFILE_TOGGLE}']"))
+    return output
+
+
 def make_tests(action, test_dir):
     tests = XMLNode('tests')
     for idx, example in enumerate(action.examples.values()):
@@ -147,8 +220,13 @@ def make_help(plugin, action, data_dir):
 
 
 def make_command(plugin, action):
+    schema = make_schema_filename(plugin, action)
     return XMLNode(
-        'command', f"q2galaxy run {plugin.id} {action.id} '$inputs'",
+        'command', f"#if ${EXTRA_OPTS}.{PROFILE_TOGGLE}\n"
+                   f"export {PROFILE_ENV}='{PROFILE_FILENAME}' &&\n"
+                   f"#end if\n"
+                   f"q2galaxy run {plugin.id} {action.id} '$inputs'"
+                   f" --schema '$__tool_directory__/{schema}'",
         detect_errors="exit_code")
 
 
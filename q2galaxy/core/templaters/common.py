@@ -14,6 +14,8 @@ import qiime2.sdk as sdk
 
 import q2galaxy
 from q2galaxy.core.util import XMLNode, rst_header
+from q2galaxy.core.templaters.macros import get_suite_macros
+from q2galaxy.core.templaters.containers import make_containers
 
 
 def make_tool_id(plugin_id, action_id):
@@ -49,39 +51,65 @@ def make_citations(plugin=None, action=None):
         citations.extend(action.citations)
     if plugin is not None:
         citations.extend(plugin.citations)
+    citations_xml.extend(_make_citation_nodes(citations, 'cite'))
+
+    # The framework's citations are the same for every tool, and are keyed
+    # apart from the tool's own (which may sit beside them in a macro)
+    framework = _make_citation_nodes(qiime2.__citations__, 'framework-cite')
+    macros = get_suite_macros()
+    if macros is None:
+        citations_xml.extend(framework)
+    else:
+        citations_xml.append(macros.expand('citations', framework))
+
+    return citations_xml
 
-    citations.extend(qiime2.__citations__)
 
+def _make_citation_nodes(citations, prefix):
+    nodes = []
     for idx, cite_record in enumerate(citations, 1):
         doi = cite_record.fields.get('doi')
         if doi is not None:
-            citations_xml.append(XMLNode('citation', doi, type='doi'))
+            nodes.append(XMLNode('citation', doi, type='doi'))
         else:
             with io.StringIO() as fh:
-                sdk.Citations([(f'cite{idx}', cite_record)]).save(fh)
-                citations_xml.append(XMLNode('citation', fh.getvalue(),
-                                             type='bibtex'))
-
-    return citations_xml
+                sdk.Citations([(f'{prefix}{idx}', cite_record)]).save(fh)
+                nodes.append(XMLNode('citation', fh.getvalue(),
+                                     type='bibtex'))
+    return nodes
 
 
 def make_requirements(conda_meta, *project_names):
     if len(project_names) == 1 and project_names[0] == 'q2-mystery-stew':
         pass
 
-    requirements = XMLNode('requirements')
+    nodes = []
     if conda_meta.metapackage is None:
-        requirements.append(
+        nodes.append(
             XMLNode('requirement', 'q2galaxy',
                     type='package', version=q2galaxy.__version__))
     for dep, version in conda_meta.iter_deps(*project_names,
                                              include_self=True):
         r = XMLNode('requirement', dep, type='package', version=version)
-        requirements.append(r)
+        nodes.append(r)
+    # the distribution's image, if one was given (see containers.py)
+    nodes.extend(make_containers())
+
+    requirements = XMLNode('requirements')
+    macros = get_suite_macros()
+    if macros is None:
+        requirements.extend(nodes)
+    else:
+        requirements.append(macros.expand('requirements', nodes))
 
     return requirements
 
 
+def project_names(plugins):
+    # sorted, so that the builtins share one (cached) requirements closure
+    return sorted({plugin.project_name for plugin in plugins})
+
+
 def make_builtin_version(plugins):
     env_hash = 0
     for plugin in plugins:
@@ -102,23 +130,34 @@ def make_formats_help(formats):
     help_ = rst_header('Formats:', 2)
     help_ += 'These formats have documentation available.\n'
     missing = []
-    for format_ in formats:
-        if format_.__doc__ is None:
+    # sorted, as `formats` is usually a set
+    for format_ in sorted(formats, key=lambda x: x.name):
+        if format_.doc is None:
             missing.append(format_)
             continue
-        help_ += rst_header(format_.__name__, 3)
-        help_ += dedent("    " + format_.__doc__)
+        doc = rst_header(format_.name, 3)
+        doc += dedent("    " + format_.doc)
+        # import and export both document most formats
+        macros = get_suite_macros()
+        if macros is not None:
+            doc = macros.token('format_help', doc)
+        help_ += doc
 
     if missing:
         help_ += rst_header('Additional formats without documentation:', 3)
         for format_ in missing:
-            help_ += f' - {format_.__name__}\n'
+            help_ += f' - {format_.name}\n'
 
     return help_
 
 
 def make_xrefs():
+    nodes = [XMLNode('xref', 'qiime2', type='bio.tools')]
+
     xrefs = XMLNode('xrefs')
-    xrefs.append(
-        XMLNode('xref', 'qiime2', type='bio.tools'))
+    macros = get_suite_macros()
+    if macros is None:
+        xrefs.extend(nodes)
+    else:
+        xrefs.append(macros.expand('xrefs', nodes))
     return xrefs
@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import re
+import contextlib
+import collections
+
+from q2galaxy.core.util import XMLNode
+
+# A prebuilt image of the whole distribution can be given to every tool as a
+# <container> alongside its conda requirements, so that Galaxy (when it runs
+# jobs in containers) pulls one cached image instead of resolving, or
+# building, an environment for each distinct set of requirements. Docker
+# images must be pinned by digest, as a tag can be moved. The containers
+# manifest records which conda environment the image holds.
+CONTAINERS_FILENAME = 'q2galaxy-containers.json'
+CONTAINERS_FORMAT = 'q2galaxy-containers'
+CONTAINERS_VERSION = 1
+
+ContainerImage = collections.namedtuple('ContainerImage',
+                                        ['type', 'image', 'digest'])
+
+_DIGEST = re.compile(r'@(sha256:[0-9a-f]{64})$')
+
+_CURRENT_IMAGES = ()
+
+
+def parse_container(type_, image):
+    match = _DIGEST.search(image)
+    if match is None and type_ == 'docker':
+        raise ValueError(f"{image!r} is not pinned by digest, expected e.g."
+                         " quay.io/qiime2/amplicon@sha256:<64 hex digits>.")
+    return ContainerImage(type_, image,
+                          None if match is None else match.group(1))
+
+
+@contextlib.contextmanager
+def container_images(images=()):
+    # Nested sessions without images of their own (e.g. each plugin of
+    # template_all_iter) keep the enclosing session's
+    global _CURRENT_IMAGES
+    previous = _CURRENT_IMAGES
+    if images:
+        _CURRENT_IMAGES = tuple(images)
+    try:
+        yield _CURRENT_IMAGES
+    finally:
+        _CURRENT_IMAGES = previous
+
+
+def get_container_images():
+    return _CURRENT_IMAGES
+
+
+def make_containers():
+    return [XMLNode('container', image.image, type=image.type)
+            for image in _CURRENT_IMAGES]
+
+
+def make_containers_manifest(images, conda_meta, **versions):
+    # every package in the environment the tools were templated from, which
+    # is the environment the image should hold
+    packages = {name: conda_meta.get_version(name)
+                for name in sorted(conda_meta.meta_lookup)}
+    return {'format': CONTAINERS_FORMAT, 'version': CONTAINERS_VERSION,
+            **versions,
+            'containers': [image._asdict() for image in images],
+            'environment': {'metapackage': conda_meta.metapackage,
+                            'packages': packages}}
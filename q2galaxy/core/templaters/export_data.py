@@ -5,18 +5,17 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
-import qiime2.sdk as sdk
-import qiime2.plugin.model as model
-from qiime2.sdk.plugin_manager import GetFormatFilters
-
 from q2galaxy.core.util import XMLNode, galaxy_esc, pretty_fmt_name, rst_header
 from q2galaxy.core.templaters.common import (
     make_builtin_version, make_requirements, make_tool_name_from_id,
-    make_config, make_citations, make_formats_help, make_xrefs)
+    make_config, make_citations, make_formats_help, make_xrefs,
+    project_names)
+from q2galaxy.core.templaters.registry import (get_registry_index,
+                                               is_directory_format)
 
 
-def make_builtin_export(meta, tool_id):
-    pm = sdk.PluginManager()
+def make_builtin_export(meta, tool_id, family=None):
+    index = get_registry_index()
     inputs = XMLNode('inputs')
 
     # This also works for qzvs even though the format just says qza so. . .
@@ -65,32 +64,28 @@ def make_builtin_export(meta, tool_id):
 
     plugins = set()
     known_formats = set()
-    for record in sorted(pm.get_semantic_types().values(),
-                         key=lambda x: str(x.semantic_type)):
+    records = index.records if family is None else index.families[family]
+    for record in records:
         plugins.add(record.plugin)
 
-        type_option = XMLNode('option', str(record.semantic_type),
-                              value=galaxy_esc(str(record.semantic_type)))
+        type_option = XMLNode('option', record.semantic_type,
+                              value=galaxy_esc(record.semantic_type))
         type_.append(type_option)
 
-        when = XMLNode('when', value=galaxy_esc(str(record.semantic_type)))
+        when = XMLNode('when', value=galaxy_esc(record.semantic_type))
         select = XMLNode('param', type='select', name='output_format',
                          label="QIIME 2 file format to convert to:")
 
         select.append(XMLNode('option', 'export as is (no conversion)',
                       value='None', selected='true'))
 
-        for fmt_rec in sorted(
-                pm.get_formats(filter=GetFormatFilters.EXPORTABLE,
-                               semantic_type=record.semantic_type).values(),
-                key=lambda x: x.format.__name__):
-            plugins.add(fmt_rec.plugin)
-            known_formats.add(fmt_rec.format)
-
-            if not issubclass(fmt_rec.format,
-                              model.SingleFileDirectoryFormatBase):
-                option = XMLNode('option', pretty_fmt_name(fmt_rec.format),
-                                 value=galaxy_esc(fmt_rec.format.__name__))
+        for fmt, plugin in index.exportable[record.semantic_type]:
+            plugins.add(plugin)
+            known_formats.add(fmt)
+
+            if fmt.kind != 'single_file_directory':
+                option = XMLNode('option', pretty_fmt_name(fmt.name),
+                                 value=galaxy_esc(fmt.name))
                 select.append(option)
 
         when.append(select)
@@ -102,32 +97,33 @@ def make_builtin_export(meta, tool_id):
     collection = XMLNode('collection', name='exported', type='list',
                          label='${tool.name} on ${on_string} as ${fmt_peek}')
 
-    _filter_set = repr({galaxy_esc(x.__name__) for x in known_formats})
+    # sorted, as a set's order changes with each interpreter's hash seed
+    _filter_set = '{%s}' % ', '.join(sorted(
+        repr(galaxy_esc(x.name)) for x in known_formats))
     collection.append(XMLNode('filter', "fmt_finder['output_format'] == 'None'"
                               f" and fmt_peek not in {_filter_set}"))
     collection.append(XMLNode('discover_datasets', visible='false',
                               pattern='__designation_and_ext__'))
     outputs.append(collection)
 
-    for fmt in sorted(known_formats, key=lambda x: x.__name__):
-        esc_fmt = galaxy_esc(fmt.__name__)
+    for fmt in sorted(known_formats, key=lambda x: x.name):
+        esc_fmt = galaxy_esc(fmt.name)
         filter_exp = (f"fmt_finder['output_format'] == '{esc_fmt}'"
                       " or (fmt_finder['output_format'] == 'None' and fmt_peek"
                       f" == '{esc_fmt}')")
-        label = '${tool.name} on ${on_string} as ' + fmt.__name__
-        if issubclass(fmt, model.DirectoryFormat):
+        label = '${tool.name} on ${on_string} as ' + fmt.name
+        if is_directory_format(fmt):
             dyn_data = None
-            for field in fmt._fields:  # file attrs of the dirfmt
-                file_attr = getattr(fmt, field)
+            for file_attr in fmt.fields:  # file attrs of the dirfmt
                 pattern, has_ext = pathspec_to_galaxy_regex(file_attr.pathspec)
                 extras = {}
                 if not has_ext:
-                    if issubclass(file_attr.format, model.TextFileFormat):
+                    if file_attr.format.kind == 'text':
                         extras['ext'] = 'txt'
                     else:
                         extras['ext'] = 'data'
 
-                if isinstance(file_attr, model.FileCollection):
+                if file_attr.collection:
                     col = XMLNode('collection', type='list',
                                   name='_'.join([esc_fmt, file_attr.name]),
                                   label=label + f' ({file_attr.name})')
@@ -162,13 +158,17 @@ def make_builtin_export(meta, tool_id):
 
     tool = XMLNode('tool', id=tool_id, name=make_tool_name_from_id(tool_id),
                    version=make_builtin_version(plugins))
-    tool.append(XMLNode('description', 'Export data from a QIIME 2 artifact'))
+    if family is None:
+        description = 'Export data from a QIIME 2 artifact'
+    else:
+        description = f'Export data from a QIIME 2 {family} artifact'
+    tool.append(XMLNode('description', description))
     tool.append(XMLNode('command', "q2galaxy run tools export '$inputs'"))
     tool.append(make_config())
     tool.append(inputs)
     tool.append(outputs)
     tool.append(make_citations())
-    tool.append(make_requirements(meta, *[p.project_name for p in plugins]))
+    tool.append(make_requirements(meta, *project_names(plugins)))
     tool.append(_make_help(known_formats))
     tool.append(make_xrefs())
 
@@ -16,6 +16,7 @@ from qiime2 import ResultCollection
 from qiime2.core.type.grammar import UnionExp, IntersectionExp
 
 from q2galaxy.core.util import XMLNode, galaxy_esc, galaxy_ui_var
+from q2galaxy.core.trace import traced
 
 
 def signature_to_galaxy(signature, arguments=None, data_dir=None):
@@ -38,6 +39,7 @@ def is_union_anywhere(qiime_type):
         qiime_type.predicate is not None and is_union(qiime_type.predicate))
 
 
+@traced(cat='templaters')
 def identify_arg_case(name, spec, arg, data_dir=None):
     style = interrogate_collection_type(spec.qiime_type)
 
@@ -92,6 +94,11 @@ class ParamCase:
     def tests_xml(self):
         raise NotImplementedError(self.__class__)
 
+    def input_schema(self):
+        return {'kind': 'primitive', 'collection': None,
+                'required': not self.spec.has_default(),
+                'type': str(self.spec.qiime_type)}
+
     def rst_instructions(self):
         if self.spec.has_default() and self.spec.default == self.arg:
             return (f'Leave *"{self.name}"* as its default value of'
@@ -138,6 +145,9 @@ class NotImplementedCase(ParamCase):
     def tests_xml(self):
         return XMLNode("param", name=self.name, value=str(self.arg))
 
+    def input_schema(self):
+        return {**super().input_schema(), 'kind': 'unsupported'}
+
 
 class MetadataTabularCase(ParamCase):
     def inputs_xml(self):
@@ -198,6 +208,9 @@ class MetadataTabularCase(ParamCase):
             merged.append(repeat)
         return merged
 
+    def input_schema(self):
+        return {**super().input_schema(), 'kind': 'metadata'}
+
     def rst_instructions(self):
         if self.arg is None:
             return f'Leave *"{self.name}"* unchanged (do not insert an entry).'
@@ -284,6 +297,9 @@ class ColumnTabularCase(ParamCase):
         cond.append(XMLNode('param', name='column', value=column))
         return cond
 
+    def input_schema(self):
+        return {**super().input_schema(), 'kind': 'metadata_column'}
+
     def rst_instructions(self):
         if self.arg is None:
             return super().rst_instructions()
@@ -387,6 +403,12 @@ class InputCase(ParamCase):
             arg = str(self.arg)
         return XMLNode('param', name=self.name, value=arg, ftype='qza')
 
+    def input_schema(self):
+        schema = {**super().input_schema(), 'kind': 'artifact'}
+        if self.multiple:
+            schema['collection'] = self.spec.qiime_type.name
+        return schema
+
     def rst_instructions(self):
         if not self.multiple or self.spec.qiime_type.name == 'Collection':
             return super().rst_instructions()
@@ -751,6 +773,10 @@ class SimpleCollectionCase(ParamCase):
 
         return roots
 
+    def input_schema(self):
+        return {**super().input_schema(),
+                'collection': self.spec.qiime_type.name}
+
     def rst_instructions(self):
         if self.arg is None:
             return super().rst_instructions()
@@ -7,22 +7,21 @@
 # ----------------------------------------------------------------------------
 from textwrap import dedent
 
-import qiime2.plugin.model as model
-import qiime2.sdk as sdk
-from qiime2.sdk.plugin_manager import GetFormatFilters
-
 from q2galaxy.core.util import (XMLNode, galaxy_esc, pretty_fmt_name,
                                 galaxy_ui_var, rst_header)
 from q2galaxy.core.templaters.common import (make_builtin_version,
                                              make_tool_name_from_id,
                                              make_requirements,
+                                             project_names,
                                              make_citations,
                                              make_formats_help,
                                              make_xrefs)
+from q2galaxy.core.templaters.registry import (get_registry_index,
+                                               is_directory_format)
 
 
-def make_builtin_import(meta, tool_id):
-    pm = sdk.PluginManager()
+def make_builtin_import(meta, tool_id, family=None):
+    index = get_registry_index()
     inputs = XMLNode('inputs')
 
     # Not a galaxy_ui_var() because this will be taken by name from the
@@ -39,18 +38,17 @@ def make_builtin_import(meta, tool_id):
     when = XMLNode('when', value="None")
     conditional.append(when)
 
-    default_formats = _get_default_formats(pm)
     plugins = set()
     known_formats = set()
-    for record in sorted(pm.get_semantic_types().values(),
-                         key=lambda x: str(x.semantic_type)):
+    records = index.records if family is None else index.families[family]
+    for record in records:
         plugins.add(record.plugin)
 
-        type_option = XMLNode('option', str(record.semantic_type),
-                              value=galaxy_esc(str(record.semantic_type)))
+        type_option = XMLNode('option', record.semantic_type,
+                              value=galaxy_esc(record.semantic_type))
         type_.append(type_option)
 
-        when = XMLNode('when', value=galaxy_esc(str(record.semantic_type)))
+        when = XMLNode('when', value=galaxy_esc(record.semantic_type))
 
         fmt_conditional = XMLNode(
             'conditional', name=galaxy_ui_var(tag='cond', name='format'))
@@ -60,38 +58,20 @@ def make_builtin_import(meta, tool_id):
 
         when.append(fmt_conditional)
 
-        default_format = default_formats[record.semantic_type]
-        seen_formats = set()
-        for fmt_rec in sorted(
-                pm.get_formats(filter=GetFormatFilters.IMPORTABLE,
-                               semantic_type=record.semantic_type).values(),
-                key=lambda x: x.format.__name__):
-            if issubclass(fmt_rec.format,
-                          model.SingleFileDirectoryFormatBase):
-                # These are really just noise for the galaxy UI
-                # an implicit transformation from the backing file format
-                # is simpler and removes the redundancy
-                fmt = fmt_rec.format.file.format
-                plugin = fmt_rec.plugin
-            else:
-                fmt = fmt_rec.format
-                plugin = fmt_rec.plugin
-
-            if fmt not in seen_formats:
-                plugins.add(plugin)
-                known_formats.add(fmt)
-                seen_formats.add(fmt)
+        default_format = index.default_formats[record.semantic_type]
+        for fmt, plugin in index.importable[record.semantic_type]:
+            plugins.add(plugin)
+            known_formats.add(fmt)
 
-                option = XMLNode('option', pretty_fmt_name(fmt),
-                                 value=galaxy_esc(fmt.__name__),
-                                 selected=str(fmt == default_format).lower())
-                select.append(option)
+            option = XMLNode('option', pretty_fmt_name(fmt.name),
+                             value=galaxy_esc(fmt.name),
+                             selected=str(fmt == default_format).lower())
+            select.append(option)
 
-                fmt_when = XMLNode('when',
-                                   value=galaxy_esc(fmt.__name__))
-                fmt_conditional.append(fmt_when)
+            fmt_when = XMLNode('when', value=galaxy_esc(fmt.name))
+            fmt_conditional.append(fmt_when)
 
-                _add_format_ui(fmt_when, fmt)
+            _add_format_ui(fmt_when, fmt)
 
         conditional.append(when)
 
@@ -107,9 +87,13 @@ def make_builtin_import(meta, tool_id):
     tool.append(
         XMLNode('command', "q2galaxy run tools import '$inputs'"))
     tool.append(_make_config())
-    tool.append(XMLNode('description', 'Import data into a QIIME 2 artifact'))
+    if family is None:
+        description = 'Import data into a QIIME 2 artifact'
+    else:
+        description = f'Import data into a QIIME 2 {family} artifact'
+    tool.append(XMLNode('description', description))
     tool.append(make_citations())
-    tool.append(make_requirements(meta, *[p.project_name for p in plugins]))
+    tool.append(make_requirements(meta, *project_names(plugins)))
     tool.append(_make_help(known_formats))
     tool.append(make_xrefs())
     return tool
@@ -123,11 +107,9 @@ def _make_config():
 
 
 def _add_format_ui(root, format):
-    if issubclass(format, model.DirectoryFormat):
-        for field in format._fields:
-            file_attr = getattr(format, field)
-
-            if isinstance(file_attr, model.FileCollection):
+    if is_directory_format(format):
+        for file_attr in format.fields:
+            if file_attr.collection:
                 _add_collection_ui(root, file_attr)
             else:
                 section = XMLNode(
@@ -198,7 +180,7 @@ def _add_collection_ui(root, file_attr):
 
 
 def _format_help_text(format):
-    return (f'This data should be formatted as a {format.__name__}.'
+    return (f'This data should be formatted as a {format.name}.'
             ' See the documentation below for more information.')
 
 
@@ -242,18 +224,6 @@ def _add_data_ui(root, file_attr):
                         help=_format_help_text(file_attr.format)))
 
 
-def _get_default_formats(pm):
-    default_formats = {}
-    for rec in pm.type_formats:
-        fmt = rec.format
-        if issubclass(fmt, model.SingleFileDirectoryFormatBase):
-            fmt = fmt.file.format
-        for semantic_type in rec.type_expression:
-            default_formats[semantic_type] = fmt
-
-    return default_formats
-
-
 # ! IMPORTANT !
 # This function is never called, but its source code is stolen for a
 # PSP body to be templated by Cheetah. This is written here to permit basic
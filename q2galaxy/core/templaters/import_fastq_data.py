@@ -5,23 +5,18 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
-from qiime2.sdk import PluginManager
-
 from q2galaxy.core.util import XMLNode
 from q2galaxy.core.templaters.common import (make_builtin_version,
                                              make_tool_name_from_id,
                                              make_requirements,
+                                             project_names,
                                              make_citations,
                                              make_xrefs)
+from q2galaxy.core.templaters.registry import get_registry_index
 
 
 def make_builtin_import_fastq(meta, tool_id):
-    pm = PluginManager()
-
-    plugins = set()
-    for record in sorted(pm.get_semantic_types().values(),
-                         key=lambda x: str(x.semantic_type)):
-        plugins.add(record.plugin)
+    plugins = {record.plugin for record in get_registry_index().records}
 
     tool = XMLNode('tool', id=tool_id, name=make_tool_name_from_id(tool_id),
                    version=make_builtin_version(plugins))
@@ -33,7 +28,7 @@ def make_builtin_import_fastq(meta, tool_id):
                         'Import fastq data into a QIIME 2 artifact'))
     tool.append(_make_config())
     tool.append(make_citations())
-    tool.append(make_requirements(meta, *[p.project_name for p in plugins]))
+    tool.append(make_requirements(meta, *project_names(plugins)))
     tool.append(make_xrefs())
     return tool
 
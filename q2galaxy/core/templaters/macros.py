@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import copy
+import hashlib
+import contextlib
+
+import lxml.etree as xml
+
+from q2galaxy.core.util import XMLNode
+
+# Every tool in a suite repeats the same requirements, xrefs, framework
+# citations, and (for the builtins) format documentation. When templating
+# with macros, these are written once to the suite's macros.xml and each tool
+# expands them instead. Names carry a hash of their content, so identical
+# blocks are shared and differing ones can't collide.
+MACROS_FILENAME = 'macros.xml'
+
+_CURRENT_MACROS = None
+
+
+class SuiteMacros:
+    def __init__(self):
+        self.xml = {}
+        self.tokens = {}
+
+    def expand(self, kind, children):
+        # e.g. <requirements><expand macro="requirements_..."/></requirements>
+        children = list(children)
+        name = f'{kind}_{_digest(*(xml.tostring(c) for c in children))}'
+        if name not in self.xml:
+            macro = XMLNode('xml', name=name)
+            macro.extend(copy.deepcopy(c) for c in children)
+            self.xml[name] = macro
+        return XMLNode('expand', macro=name)
+
+    def token(self, kind, text):
+        name = f'@{kind.upper()}_{_digest(text.encode("utf8")).upper()}@'
+        self.tokens.setdefault(name, text)
+        return name
+
+    def update_from_xml(self, macros):
+        # e.g. the macros.xml of each shard of a sharded run, the names are
+        # content hashes, so a repeated name is the same definition
+        for child in macros:
+            if child.tag == 'token':
+                self.tokens.setdefault(child.get('name'), child.text)
+            elif child.tag == 'xml':
+                self.xml.setdefault(child.get('name'), child)
+
+    def __bool__(self):
+        return bool(self.xml or self.tokens)
+
+    def to_xml(self):
+        macros = XMLNode('macros')
+        for name in sorted(self.tokens):
+            macros.append(XMLNode('token', self.tokens[name], name=name))
+        for name in sorted(self.xml):
+            macros.append(self.xml[name])
+        return macros
+
+
+@contextlib.contextmanager
+def suite_macros(enabled=True):
+    global _CURRENT_MACROS
+    if not enabled:
+        yield None
+        return
+
+    previous = _CURRENT_MACROS
+    _CURRENT_MACROS = SuiteMacros()
+    try:
+        yield _CURRENT_MACROS
+    finally:
+        _CURRENT_MACROS = previous
+
+
+def get_suite_macros():
+    return _CURRENT_MACROS
+
+
+def make_macros_import():
+    macros = XMLNode('macros')
+    macros.append(XMLNode('import', MACROS_FILENAME))
+    return macros
+
+
+def _digest(*blobs):
+    digest = hashlib.sha1()
+    for blob in blobs:
+        digest.update(blob)
+        digest.update(b'\0')
+    return digest.hexdigest()[:10]
@@ -0,0 +1,174 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import types
+import contextlib
+import collections
+
+import qiime2.plugin.model as model
+import qiime2.sdk as sdk
+from qiime2.sdk.plugin_manager import GetFormatFilters
+
+from q2galaxy.core.drivers.builtins import import_fastq_available
+
+# What the builtins need from the plugin registry, resolved once:
+#   records: every semantic type's TypeRecord, sorted by type
+#   families: top-level type name (e.g. FeatureTable) -> its records
+#   importable: semantic type -> ((format, plugin), ...) in the UI's order,
+#       with single-file directory formats replaced by their file format
+#   exportable: semantic type -> ((format, plugin), ...) sorted by name
+#   default_formats: semantic type -> the format it is stored as
+#   import_fastq: whether q2-types can import fastq (import_fastq_available)
+# Types are keyed by their string, and plugins and formats are plain records,
+# so the index can be kept in a snapshot (see q2galaxy.core.snapshot) and used
+# where the plugins aren't installed. It is immutable, so the makers of a
+# templating session can share it.
+RegistryIndex = collections.namedtuple(
+    'RegistryIndex', ['records', 'families', 'importable', 'exportable',
+                      'default_formats', 'import_fastq'])
+
+PluginRecord = collections.namedtuple(
+    'PluginRecord', ['id', 'version', 'project_name'])
+TypeRecord = collections.namedtuple(
+    'TypeRecord', ['semantic_type', 'family', 'plugin'])
+# kind is one of FORMAT_KINDS, fields are a directory format's FieldRecords
+FormatRecord = collections.namedtuple(
+    'FormatRecord', ['name', 'doc', 'kind', 'fields'])
+FieldRecord = collections.namedtuple(
+    'FieldRecord', ['name', 'pathspec', 'format', 'collection'])
+
+FORMAT_KINDS = ('text', 'binary', 'directory', 'single_file_directory')
+
+_CURRENT_INDEX = None
+
+
+@contextlib.contextmanager
+def registry_index(index=None):
+    # Nested sessions without an index of their own (e.g. the builtins of a
+    # snapshot's template_all_iter) keep the enclosing session's
+    global _CURRENT_INDEX
+    previous = _CURRENT_INDEX
+    if index is not None:
+        _CURRENT_INDEX = index
+    elif previous is None:
+        _CURRENT_INDEX = _build_index(sdk.PluginManager())
+    try:
+        yield _CURRENT_INDEX
+    finally:
+        _CURRENT_INDEX = previous
+
+
+def get_registry_index():
+    # outside of a session (e.g. a single maker), nothing is kept around
+    if _CURRENT_INDEX is None:
+        return _build_index(sdk.PluginManager())
+    return _CURRENT_INDEX
+
+
+def is_directory_format(fmt):
+    return fmt.kind in ('directory', 'single_file_directory')
+
+
+def _build_index(pm):
+    records = tuple(sorted(pm.get_semantic_types().values(),
+                           key=lambda x: str(x.semantic_type)))
+
+    formats = {}
+    type_records = []
+    families = collections.defaultdict(list)
+    importable = {}
+    exportable = {}
+    for record in records:
+        semantic_type = record.semantic_type
+        key = str(semantic_type)
+        type_record = TypeRecord(key, semantic_type.name,
+                                 _plugin_record(record.plugin))
+        type_records.append(type_record)
+        families[semantic_type.name].append(type_record)
+        importable[key] = tuple(
+            (_format_record(fmt, formats), _plugin_record(plugin))
+            for fmt, plugin in _importable_formats(pm, semantic_type))
+        exportable[key] = tuple(
+            (_format_record(fmt_rec.format, formats),
+             _plugin_record(fmt_rec.plugin))
+            for fmt_rec in _get_formats(pm, GetFormatFilters.EXPORTABLE,
+                                        semantic_type))
+
+    return RegistryIndex(
+        records=tuple(type_records),
+        families=types.MappingProxyType(
+            {name: tuple(families[name]) for name in sorted(families)}),
+        importable=types.MappingProxyType(importable),
+        exportable=types.MappingProxyType(exportable),
+        default_formats=types.MappingProxyType(
+            _get_default_formats(pm, formats)),
+        import_fastq=import_fastq_available())
+
+
+def _plugin_record(plugin):
+    return PluginRecord(plugin.id, plugin.version, plugin.project_name)
+
+
+def _format_record(fmt, formats):
+    # `formats` memoizes the records by class
+    if fmt not in formats:
+        if issubclass(fmt, model.SingleFileDirectoryFormatBase):
+            kind = 'single_file_directory'
+        elif issubclass(fmt, model.DirectoryFormat):
+            kind = 'directory'
+        elif issubclass(fmt, model.TextFileFormat):
+            kind = 'text'
+        else:
+            kind = 'binary'
+
+        fields = []
+        if kind in ('directory', 'single_file_directory'):
+            for field in fmt._fields:
+                file_attr = getattr(fmt, field)
+                fields.append(FieldRecord(
+                    file_attr.name, file_attr.pathspec,
+                    _format_record(file_attr.format, formats),
+                    isinstance(file_attr, model.FileCollection)))
+        formats[fmt] = FormatRecord(fmt.__name__, fmt.__doc__, kind,
+                                    tuple(fields))
+    return formats[fmt]
+
+
+def _get_formats(pm, filter_, semantic_type):
+    return sorted(pm.get_formats(filter=filter_,
+                                 semantic_type=semantic_type).values(),
+                  key=lambda x: x.format.__name__)
+
+
+def _importable_formats(pm, semantic_type):
+    formats = []
+    seen_formats = set()
+    for fmt_rec in _get_formats(pm, GetFormatFilters.IMPORTABLE,
+                                semantic_type):
+        fmt = fmt_rec.format
+        if issubclass(fmt, model.SingleFileDirectoryFormatBase):
+            # These are really just noise for the galaxy UI
+            # an implicit transformation from the backing file format
+            # is simpler and removes the redundancy
+            fmt = fmt.file.format
+
+        if fmt not in seen_formats:
+            seen_formats.add(fmt)
+            formats.append((fmt, fmt_rec.plugin))
+    return tuple(formats)
+
+
+def _get_default_formats(pm, formats):
+    default_formats = {}
+    for rec in pm.type_formats:
+        fmt = rec.format
+        if issubclass(fmt, model.SingleFileDirectoryFormatBase):
+            fmt = fmt.file.format
+        for semantic_type in rec.type_expression:
+            default_formats[str(semantic_type)] = _format_record(fmt, formats)
+
+    return default_formats
@@ -0,0 +1,87 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2018-2023, QIIME 2 development team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+import os
+import json
+import time
+import functools
+import threading
+import contextlib
+
+# Spans are recorded as Chrome trace events ("complete" events), which can be
+# opened in Perfetto (https://ui.perfetto.dev) or chrome://tracing. Tracing is
+# enabled by `q2galaxy template --trace <path>`, or this variable for `run`.
+TRACE_ENV = 'Q2GALAXY_TRACE'
+
+# When tracing is off, every span is this same (reusable) no-op context
+_NULL_SPAN = contextlib.nullcontext()
+
+_CURRENT_TRACE = None
+
+
+class Trace:
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.events = []
+        self._origin = time.perf_counter_ns()
+
+    @contextlib.contextmanager
+    def span(self, name, cat, args):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            event = {'name': name, 'cat': cat, 'ph': 'X',
+                     'ts': (start - self._origin) / 1000,
+                     'dur': (end - start) / 1000,
+                     'pid': self.pid, 'tid': threading.get_ident()}
+            if args:
+                event['args'] = {k: str(v) for k, v in args.items()}
+            self.events.append(event)
+
+    def flush(self):
+        with open(self.path, 'w') as fh:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, fh)
+            fh.write('\n')
+
+
+@contextlib.contextmanager
+def tracing(path):
+    global _CURRENT_TRACE
+    if not path:
+        yield None
+        return
+
+    trace = Trace(path)
+    _CURRENT_TRACE = trace
+    try:
+        yield trace
+    finally:
+        _CURRENT_TRACE = None
+        trace.flush()
+
+
+def span(name, cat='q2galaxy', **args):
+    if _CURRENT_TRACE is None:
+        return _NULL_SPAN
+    return _CURRENT_TRACE.span(name, cat, args)
+
+
+def traced(cat='q2galaxy'):
+    def _decorator(function):
+        @functools.wraps(function)
+        def wrapped(*args, **kwargs):
+            if _CURRENT_TRACE is None:
+                return function(*args, **kwargs)
+            with _CURRENT_TRACE.span(function.__qualname__, cat, None):
+                return function(*args, **kwargs)
+
+        return wrapped
+    return _decorator
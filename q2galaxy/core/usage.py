@@ -7,11 +7,15 @@
 # ----------------------------------------------------------------------------
 import os
 import re
+import time
+import shutil
+import tempfile
 
 from qiime2.sdk.usage import Usage, UsageVariable
 from qiime2.core.type.util import is_collection_type
 
-from q2galaxy.core.util import XMLNode
+from q2galaxy.core.util import XMLNode, replace_if_changed
+from q2galaxy.core.reproducible import normalize_test_data
 from q2galaxy.core.templaters.helpers import signature_to_galaxy
 
 
@@ -19,7 +23,17 @@ def collect_test_data(action, test_dir):
     for idx, example in enumerate(action.examples.values()):
         use = GalaxyTestUsage(example_path=(action, idx), write_dir=test_dir)
         example(use)
-        yield from use.created_files
+        for status in use.created_files:
+            yield {**status, 'plugin': action.plugin_id, 'action': action.id}
+
+
+def path_size(path):
+    # collections are saved as a directory
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(dirpath, filename))
+               for dirpath, _, filenames in os.walk(path)
+               for filename in filenames)
 
 
 class GalaxyBaseUsageVariable(UsageVariable):
@@ -96,12 +110,34 @@ class GalaxyTestUsageVariable(GalaxyBaseUsageVariable):
         basename = self.to_interface_name(skip_ref=True)
         path = os.path.join(write_dir, basename)
 
-        if not os.path.exists(path):
+        start = time.perf_counter()
+        is_existing = os.path.exists(path)
+
+        # saved beside the old data and only swapped in if it differs (which
+        # a file can only do in a reproducible session)
+        with tempfile.TemporaryDirectory(dir=write_dir,
+                                         prefix='.q2galaxy-') as tmp:
+            tmp_path = os.path.join(tmp, basename)
+            self.factory().save(tmp_path)
+            # stable UUIDs and timestamps, in a reproducible session
+            normalize_test_data(tmp_path, basename)
+            if os.path.isdir(tmp_path):
+                # collections are saved as a directory
+                if is_existing:
+                    shutil.rmtree(path)
+                os.replace(tmp_path, path)
+                changed = True
+            else:
+                changed = replace_if_changed(tmp_path, path)
+
+        if not is_existing:
             status = {'status': 'created', 'type': 'file', 'path': path}
-        else:
+        elif changed:
             status = {'status': 'updated', 'type': 'file', 'path': path}
-
-        self.factory().save(path)
+        else:
+            status = {'status': 'unchanged', 'type': 'file', 'path': path}
+        status['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        status['bytes'] = path_size(path)
         return status
 
     def to_interface_name(self, skip_ref=False):
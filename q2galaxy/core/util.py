@@ -5,55 +5,38 @@
 #
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
+import os
 import re
+import filecmp
+import tempfile
 import lxml.etree as xml
-import collections
-from datetime import datetime
 
 import qiime2
 import qiime2.sdk as sdk
 
 import q2galaxy
-
-
-class OrderedTool(collections.OrderedDict):
-    order = ["description", "macros", "edam_topics", "edam_operations",
-             "parallelism", "xrefs", "requirements", "code", "stdio",
-             "version_command", "command", "environment_variables",
-             "configfiles", "inputs", "request_param_translation",
-             "outputs", "tests", "help", "citations"]
-    order_attr = ['name', 'argument', 'type', 'format', 'min', 'truevalue',
-                  'max', 'falsevalue', 'value', 'checked', 'optional', 'label',
-                  'help']
-    order_attr_set = set(order_attr)
-
-    def __init__(self, items):
-        order_items = []
-        remaining_items = []
-        for item in items:
-            if item[0] in self.order_attr_set:
-                order_items.append(item)
-            else:
-                remaining_items.append(item)
-
-        order_items.sort(key=lambda x: self.order_attr.index(x[0]))
-        remaining_items.sort(key=lambda x: x[0])
-
-        super().__init__([*order_items, *remaining_items])
-
-    @classmethod
-    def sorted(cls, e):
-        new = cls._sorted_attrs(e)
-        new[:] = sorted(new, key=lambda x: cls.order.index(x.tag))
-        return new
-
-    @classmethod
-    def _sorted_attrs(cls, e):
-        new = xml.Element(e.tag, cls(e.attrib.items()))
-        new.text = e.text
-        for child in e:
-            new.append(cls._sorted_attrs(child))
-        return new
+from q2galaxy.core.reproducible import build_year
+from q2galaxy.core.trace import traced
+# re-exported, these predate q2galaxy.core.escape
+from q2galaxy.core.escape import (  # noqa: F401
+    galaxy_esc, galaxy_unesc, galaxy_ui_var)
+
+
+# The canonical order of a tool's sections, and of attributes on any element
+# (those not listed follow, alphabetically). These are rank maps, so that
+# ordering is a lookup rather than a search of the list.
+_TOOL_ORDER = ["description", "macros", "edam_topics", "edam_operations",
+               "parallelism", "xrefs", "requirements", "code", "stdio",
+               "version_command", "command", "environment_variables",
+               "configfiles", "inputs", "request_param_translation",
+               "outputs", "tests", "help", "citations"]
+_ATTR_ORDER = ['name', 'argument', 'type', 'format', 'min', 'truevalue',
+               'max', 'falsevalue', 'value', 'checked', 'optional', 'label',
+               'help']
+_TOOL_RANK = {tag: rank for rank, tag in enumerate(_TOOL_ORDER)}
+_ATTR_RANK = {attr: rank for rank, attr in enumerate(_ATTR_ORDER)}
+
+_INDENT = ' ' * 4
 
 
 def XMLNode(name_, _text=None, **attrs):
@@ -63,23 +46,110 @@ def XMLNode(name_, _text=None, **attrs):
     return e
 
 
-def write_tool(tool, filepath):
-    tool = OrderedTool.sorted(tool)
-    tool.set('profile', '22.05')
-    tool.set('license', 'BSD-3-Clause')
-    tool.addprevious(xml.Comment(COPYRIGHT))
-    tool.addprevious(xml.Comment(
-        "\nThis tool was automatically generated by:\n"
-        f"    q2galaxy (version: {q2galaxy.__version__})\n"
-        "for:\n"
-        f"    qiime2 (version: {qiime2.__version__})\n"))
-
-    tool = xml.ElementTree(tool)
-    xml.indent(tool, ' ' * 4)
-    xmlbytes = xml.tostring(tool, pretty_print=True, encoding='utf-8',
-                            xml_declaration=True)
-    with open(filepath, 'wb') as fh:
-        fh.write(xmlbytes)
+@traced(cat='util')
+def write_tool(tool, filepath, minify=False):
+    return write_if_changed(filepath, lambda fh: _write_xml(
+        tool, fh, minify, sort_children=True,
+        extra_attrs={'profile': '22.05', 'license': 'BSD-3-Clause'}))
+
+
+def write_macros(macros, filepath, minify=False):
+    return write_if_changed(filepath,
+                            lambda fh: _write_xml(macros, fh, minify))
+
+
+def write_if_changed(filepath, write):
+    # `write(fh)` writes to a temporary file beside `filepath`, which then
+    # replaces it atomically, but only if the bytes differ: Galaxy (with
+    # watch_tools) reloads every tool whose file is touched, so an unchanged
+    # file keeps its mtime. Returns the size and whether it changed.
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(filepath) or '.',
+        prefix='.' + os.path.basename(filepath) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            nbytes = write(fh)
+        changed = replace_if_changed(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return nbytes, changed
+
+
+def replace_if_changed(src, dst):
+    # `src` is moved to `dst`, or removed if `dst` has the same bytes
+    if os.path.isfile(dst) and filecmp.cmp(src, dst, shallow=False):
+        os.unlink(src)
+        return False
+    # mkstemp's files are private, these are read by Galaxy
+    os.chmod(src, 0o666 & ~_get_umask())
+    os.replace(src, dst)
+    return True
+
+
+def _get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def _write_xml(root, fh, minify, sort_children=False, extra_attrs=()):
+    # Elements are written to the file as they are visited (in canonical
+    # order), instead of sorting a copy of the tree and then serializing it
+    # in memory. The output is the same as xml.indent() followed by
+    # xml.tostring(pretty_print=True), or without either when minified.
+    header = [make_copyright(),
+              "\nThis tool was automatically generated by:\n"
+              f"    q2galaxy (version: {q2galaxy.__version__})\n"
+              "for:\n"
+              f"    qiime2 (version: {qiime2.__version__})\n"]
+
+    children = list(root)
+    if sort_children:
+        children.sort(key=lambda x: _TOOL_RANK[x.tag])
+    attrs = _canonical_attrs(root)
+    attrs.update(extra_attrs)
+
+    fh.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+    for comment in header:
+        fh.write(xml.tostring(xml.Comment(comment), encoding='utf-8'))
+        if not minify:
+            fh.write(b'\n')
+    with xml.xmlfile(fh, encoding='utf-8') as xf:
+        _write_element(xf, root.tag, attrs, root.text, children, 0,
+                       not minify)
+    fh.write(b'\n')
+    return fh.tell()
+
+
+def _write_element(xf, tag, attrs, text, children, level, pretty):
+    if not children:
+        leaf = xml.Element(tag, attrs)
+        leaf.text = text
+        xf.write(leaf)
+        return
+
+    indent = '\n' + _INDENT * (level + 1)
+    with xf.element(tag, attrs):
+        # as xml.indent() does, only whitespace is replaced
+        if pretty and (text is None or not text.strip(' \t\r\n')):
+            text = indent
+        if text:
+            xf.write(text)
+
+        last = len(children) - 1
+        for idx, child in enumerate(children):
+            _write_element(xf, child.tag, _canonical_attrs(child),
+                           child.text, list(child), level + 1, pretty)
+            if pretty:
+                xf.write(indent if idx < last else '\n' + _INDENT * level)
+
+
+def _canonical_attrs(element):
+    unranked = len(_ATTR_RANK)
+    return dict(sorted(element.attrib.items(),
+                       key=lambda x: (_ATTR_RANK.get(x[0], unranked), x[0])))
 
 
 def get_mystery_stew():
@@ -103,73 +173,7 @@ def get_mystery_stew():
     return pm.get_plugin(id='mystery_stew')
 
 
-# see: https://github.com/galaxyproject/galaxy/blob
-#      /2f3096790d4a77ba75b651f4abc43c740687c1e1/lib/galaxy/util
-#      /__init__.py#L527-L539
-# AKA: galaxy.util:mapped_chars
-_escaped = [
-    # only `[]` is likely to come up, but better safe than sorry
-    ('[', '__ob__'),
-    (']', '__cb__'),
-    ('>', '__gt__'),
-    ('<', '__lt__'),
-    ('\'', '__sq__'),
-    ('"', '__dq__'),
-    ('{', '__oc__'),
-    ('}', '__cc__'),
-    ('@', '__at__'),
-    ('\n', '__cn__'),
-    ('\r', '__cr__'),
-    ('\t', '__tc__'),
-    ('#', '__pd__'),
-    # adding this one so that <test/> won't see multiple values
-    (',', '__comma__')
-]
-_mapped = [
-    # Custom:
-    (None, '__q2galaxy__::literal::None'),
-    (True, '__q2galaxy__::literal::True'),
-    (False, '__q2galaxy__::literal::False')
-]
-
-
-def galaxy_esc(s):
-    if type(s) is str:
-        for char, esc in _escaped:
-            s = s.replace(char, esc)
-        return s
-    else:
-        for val, esc in _mapped:
-            if s is val:
-                return esc
-    raise NotImplementedError
-
-
-def galaxy_unesc(s):
-    for val, esc in _mapped:
-        if esc == s:
-            return val
-
-    for char, esc in _escaped:
-        s = s.replace(esc, char)
-    return s
-
-
-def galaxy_ui_var(*, value=None, tag=None, name=None):
-    if value is not None:
-        return f'__q2galaxy__::control::{value}'
-
-    elements = ['', 'q2galaxy', 'GUI']
-    if tag is not None:
-        elements.append(tag)
-    if name is not None:
-        elements.append(name)
-
-    elements.append('')
-    return '__'.join(elements)
-
-
-def pretty_fmt_name(format_obj):
+def pretty_fmt_name(name):
     # from SO: https://stackoverflow.com/a/9283563/579416
     spaced = re.sub(
         r"""
@@ -187,7 +191,7 @@ def pretty_fmt_name(format_obj):
         (?=[a-z])   # matches if next char is a lower char
                     # lookahead assertion: does not consume any char
         )           # end the group
-        """, r' \1', format_obj.__name__, flags=re.VERBOSE)
+        """, r' \1', name, flags=re.VERBOSE)
 
     final = []
     for token in spaced.split(' '):
@@ -206,8 +210,10 @@ def rst_header(header, level):
     return '\n'.join(['', header, fill * len(header), ''])
 
 
-COPYRIGHT = f"""
-Copyright (c) {datetime.now().year}, QIIME 2 development team.
+def make_copyright():
+    # the year is SOURCE_DATE_EPOCH's when it is set (see --reproducible)
+    return f"""
+Copyright (c) {build_year()}, QIIME 2 development team.
 
 Distributed under the terms of the Modified BSD License. (SPDX: BSD-3-Clause)
 """